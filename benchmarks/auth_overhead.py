@@ -0,0 +1,137 @@
+"""
+Cost of authenticating an API request with a session and with a signed
+token (loan.authentication): latency and queries of the authentication
+alone, and of a whole GET /api/loan-requests/ request.
+
+The response cache is off so every request renders. Run it against a
+scratch database, the user it creates is deleted at the end:
+
+    python benchmarks/auth_overhead.py --requests 2000
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'loan_managaement_system.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth.middleware import AuthenticationMiddleware  # noqa: E402
+from django.contrib.sessions.middleware import SessionMiddleware  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import Client, RequestFactory  # noqa: E402
+from django.test.utils import CaptureQueriesContext, override_settings  # noqa: E402
+from rest_framework.authentication import SessionAuthentication  # noqa: E402
+from rest_framework.request import Request  # noqa: E402
+
+from loan.authentication import SignedTokenAuthentication, make_token  # noqa: E402
+from loan.models import User  # noqa: E402
+
+URL = '/api/loan-requests/?format=json&page_size=1'
+
+
+def measure(call, requests):
+    latencies = []
+    queries = 0
+    for number in range(requests):
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            call()
+            latencies.append((time.perf_counter() - start) * 1000)
+        queries += len(captured)
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        'p50_ms': round(quantiles[49], 3),
+        'p95_ms': round(quantiles[94], 3),
+        'p99_ms': round(quantiles[98], 3),
+        'queries_per_request': round(queries / requests, 2),
+    }
+
+
+def authenticate(request, authenticator):
+    # What a view does before its own work: find the user and its role
+    user = Request(request, authenticators=[authenticator]).user
+    assert user.is_authenticated and user.role
+
+
+def run(requests):
+    username = 'bench-%s' % uuid.uuid4().hex[:8]
+    user = User.objects.create_user(username, password='bench-password', is_agent=True)
+    try:
+        session_client = Client()
+        session_client.force_login(user)
+        cookie = '%s=%s' % (
+            settings.SESSION_COOKIE_NAME,
+            session_client.cookies[settings.SESSION_COOKIE_NAME].value,
+        )
+        header = 'Bearer %s' % make_token(user)
+        token_client = Client(HTTP_AUTHORIZATION=header)
+        factory = RequestFactory()
+        middleware = [
+            SessionMiddleware(lambda request: None),
+            AuthenticationMiddleware(lambda request: None),
+        ]
+
+        def session_auth():
+            request = factory.get(URL, HTTP_COOKIE=cookie)
+            for step in middleware:
+                step.process_request(request)
+            authenticate(request, SessionAuthentication())
+
+        def token_auth():
+            request = factory.get(URL, HTTP_AUTHORIZATION=header)
+            for step in middleware:
+                step.process_request(request)
+            authenticate(request, SignedTokenAuthentication())
+
+        def get(client):
+            response = client.get(URL)
+            assert response.status_code == 200, response.status_code
+
+        with override_settings(RESPONSE_CACHE_TIMEOUT=0):
+            # Warm up the role cache and the code paths
+            for call in (session_auth, token_auth):
+                call()
+            return {
+                'authentication': {
+                    'session': measure(session_auth, requests),
+                    'token': measure(token_auth, requests),
+                },
+                'request': {
+                    'session': measure(lambda: get(session_client), requests),
+                    'token': measure(lambda: get(token_client), requests),
+                },
+            }
+    finally:
+        user.delete()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--output', help="Write the JSON report to a file")
+    args = parser.parse_args()
+
+    report = {
+        'vendor': connection.vendor,
+        'requests': args.requests,
+        **run(args.requests),
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,317 @@
+"""
+Load test of the loan API against a running server: concurrent clients
+run a weighted mix of scenarios (list with filters, apply, edit, approve,
+export) and the report gives per endpoint the throughput, p50/p95/p99
+latency, errors and queries per request as JSON.
+
+Seed a scratch database, start a server with QUERY_COUNT_HEADER on and
+point the load test at it:
+
+    python manage.py seed_loans --customers 1000 --loans 100000 \\
+        --agents 10 --admins 2 --prefix load-
+    QUERY_COUNT_HEADER=1 python manage.py runserver --noreload
+    python benchmarks/load_test.py --prefix load- --concurrency 16 \\
+        --duration 60 --output load.json
+
+Keep the report of a release and pass it as --baseline to the next run,
+the run fails if an endpoint got slower or makes more queries.
+"""
+import argparse
+import collections
+import datetime
+import itertools
+import json
+import random
+import statistics
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+LOANS = '/api/loan-requests/'
+
+# Scenario: weight in the default mix
+MIX = {'list': 50, 'apply': 20, 'edit': 10, 'approve': 10, 'export': 10}
+
+LOAN_TYPES = {'home': [120, 240, 360], 'car': [24, 48, 60], 'personal': [12, 24]}
+
+
+class Api:
+    """
+    One user's client, authenticated with a signed token that is renewed
+    before it expires
+    """
+    def __init__(self, base_url, username, password):
+        self.base_url = base_url.rstrip('/')
+        self.username = username
+        self.password = password
+        self.token = None
+        self.renew_at = 0
+
+    def call(self, method, path, data=None, token=True):
+        """
+        Status, body, query count and milliseconds of a request. The status
+        is None if the server could not be reached.
+        """
+        headers = {'Accept': 'application/json'}
+        body = None
+        if data is not None:
+            body = json.dumps(data).encode()
+            headers['Content-Type'] = 'application/json'
+        if token:
+            headers['Authorization'] = 'Bearer %s' % self.get_token()
+        request = urllib.request.Request(
+            self.base_url + path, data=body, headers=headers, method=method
+        )
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                status, content = response.status, response.read()
+                queries = response.headers.get('X-Query-Count')
+        except urllib.error.HTTPError as exc:
+            status, content = exc.code, exc.read()
+            queries = exc.headers.get('X-Query-Count')
+        except OSError:
+            status, content, queries = None, b'', None
+        milliseconds = (time.perf_counter() - start) * 1000
+        return status, content, queries and int(queries), milliseconds
+
+    def get_token(self):
+        if time.monotonic() >= self.renew_at:
+            status, content, queries, milliseconds = self.call(
+                'POST', '/api/token/', token=False,
+                data={'username': self.username, 'password': self.password},
+            )
+            if status != 200:
+                raise SystemExit(
+                    "Can not log in as %s: %s" % (self.username, status)
+                )
+            token = json.loads(content)
+            self.token = token['token']
+            self.renew_at = time.monotonic() + token['expires_in'] / 2
+        return self.token
+
+
+class Results:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = collections.defaultdict(list)
+
+    def add(self, scenario, endpoint, status, queries, milliseconds):
+        with self.lock:
+            self.calls[scenario, endpoint].append((status, queries, milliseconds))
+
+    def report(self, elapsed):
+        endpoints = {}
+        for (scenario, endpoint), calls in sorted(self.calls.items()):
+            latencies = [milliseconds for status, queries, milliseconds in calls]
+            counts = [queries for status, queries, milliseconds in calls
+                      if queries is not None]
+            endpoints[scenario] = {
+                'endpoint': endpoint,
+                'requests': len(calls),
+                'errors': sum(
+                    1 for status, queries, milliseconds in calls
+                    if status is None or status >= 400
+                ),
+                'throughput_rps': round(len(calls) / elapsed, 2),
+                **percentiles(latencies),
+                'queries_per_request':
+                    round(statistics.mean(counts), 2) if counts else None,
+                'max_queries': max(counts) if counts else None,
+            }
+        return {
+            'requests': sum(item['requests'] for item in endpoints.values()),
+            'errors': sum(item['errors'] for item in endpoints.values()),
+            'throughput_rps': round(
+                sum(len(calls) for calls in self.calls.values()) / elapsed, 2
+            ),
+            'endpoints': endpoints,
+        }
+
+
+def percentiles(latencies):
+    if len(latencies) < 2:
+        quantiles = latencies * 99
+    else:
+        quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        'p50_ms': round(quantiles[49], 3),
+        'p95_ms': round(quantiles[94], 3),
+        'p99_ms': round(quantiles[98], 3),
+    }
+
+
+class Scenarios:
+    """
+    The scenarios share the loans they create: customers apply, agents
+    edit the new loans and admins approve the edited ones
+    """
+    def __init__(self, results, rng):
+        self.results = results
+        self.rng = rng
+        self.new = collections.deque()
+        self.edited = collections.deque()
+
+    def record(self, scenario, endpoint, call):
+        status, content, queries, milliseconds = call
+        self.results.add(scenario, endpoint, status, queries, milliseconds)
+        return status, content
+
+    def filters(self):
+        rng = self.rng
+        since = datetime.date.today() - datetime.timedelta(days=rng.randrange(1, 3 * 365))
+        return rng.choice([
+            'status=%s' % rng.choice(['new', 'approved', 'rejected']),
+            'status=approved&start_date_after=%s' % since,
+            'tenure=%d' % rng.choice([12, 24, 36, 60, 120]),
+        ])
+
+    def list(self, users):
+        self.record('list', 'GET %s' % LOANS, users['agent'].call(
+            'GET', '%s?format=json&%s' % (LOANS, self.filters())
+        ))
+
+    def apply(self, users):
+        loan_type = self.rng.choice(list(LOAN_TYPES))
+        status, content = self.record('apply', 'POST %s' % LOANS, users['customer'].call(
+            'POST', LOANS, data={
+                'loan_type': loan_type,
+                'amount': self.rng.randrange(1000, 100000),
+                'tenure': self.rng.choice(LOAN_TYPES[loan_type]),
+            }
+        ))
+        if status == 201:
+            self.new.append(json.loads(content)['id'])
+
+    def edit(self, users):
+        try:
+            loan_id = self.new.popleft()
+        except IndexError:
+            return self.apply(users)
+        status, content = self.record(
+            'edit', 'PATCH %s<id>/' % LOANS, users['agent'].call(
+                'PATCH', '%s%d/' % (LOANS, loan_id),
+                data={'amount': self.rng.randrange(1000, 100000)},
+            )
+        )
+        if status == 200:
+            self.edited.append(loan_id)
+
+    def approve(self, users):
+        try:
+            loan_id = self.edited.popleft()
+        except IndexError:
+            return self.edit(users)
+        self.record('approve', 'POST %sapprove/' % LOANS, users['admin'].call(
+            'POST', '%sapprove/' % LOANS, data={'ids': [loan_id]}
+        ))
+
+    def export(self, users):
+        since = datetime.date.today() - datetime.timedelta(days=self.rng.randrange(7, 60))
+        self.record('export', 'GET %sexport/' % LOANS, users['agent'].call(
+            'GET', '%sexport/?type=csv&status=approved&start_date_after=%s'
+            % (LOANS, since)
+        ))
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    mix = dict(MIX)
+    if args.scenarios:
+        mix = {name: weight for name, weight in mix.items() if name in args.scenarios}
+    results = Results()
+    scenarios = Scenarios(results, rng)
+    names, weights = list(mix), list(mix.values())
+    counter = itertools.count()
+
+    def users(number):
+        return {
+            'customer': Api(args.base_url, '%s%d' % (args.prefix, number % args.customers), args.password),
+            'agent': Api(args.base_url, '%sagent%d' % (args.prefix, number % args.agents), args.password),
+            'admin': Api(args.base_url, '%sadmin%d' % (args.prefix, number % args.admins), args.password),
+        }
+
+    clients = [users(number) for number in range(args.concurrency)]
+    for client in clients:
+        for api in client.values():
+            api.get_token()
+
+    start = time.perf_counter()
+    deadline = start + args.duration
+
+    def worker(client):
+        while time.perf_counter() < deadline and \
+                (not args.requests or next(counter) < args.requests):
+            getattr(scenarios, rng.choices(names, weights)[0])(client)
+
+    threads = [threading.Thread(target=worker, args=(client,)) for client in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results.report(time.perf_counter() - start)
+
+
+def regressions(report, baseline, tolerance):
+    found = []
+    for scenario, before in baseline['endpoints'].items():
+        after = report['endpoints'].get(scenario)
+        if after is None:
+            continue
+        for key in ('p95_ms', 'queries_per_request'):
+            if before[key] is not None and after[key] is not None and \
+                    after[key] > before[key] * (1 + tolerance):
+                found.append("%s %s: %s -> %s" % (scenario, key, before[key], after[key]))
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--prefix', required=True,
+                        help="--prefix the database was seeded with")
+    parser.add_argument('--password', default='password')
+    parser.add_argument('--customers', type=int, default=100,
+                        help="Seeded customers to log in as")
+    parser.add_argument('--agents', type=int, default=1)
+    parser.add_argument('--admins', type=int, default=1)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=30,
+                        help="Seconds to run")
+    parser.add_argument('--requests', type=int, default=0,
+                        help="Stop after this many requests")
+    parser.add_argument('--scenario', action='append', dest='scenarios',
+                        choices=list(MIX), help="Only run this scenario, can be repeated")
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--output', help="Write the JSON report to a file")
+    parser.add_argument('--baseline', help="Report of an earlier run to compare with")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="Growth of p95 or queries counted as a regression")
+    args = parser.parse_args()
+
+    report = {
+        'base_url': args.base_url,
+        'concurrency': args.concurrency,
+        'duration': args.duration,
+        **run(args),
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            found = regressions(report, json.load(f), args.tolerance)
+        for line in found:
+            print("Regression: %s" % line, file=sys.stderr)
+        if found:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""
+Query plans and timings for the loan list / report queries, with and
+without the indexes declared on BaseModel, CustomerProfile and Loan.
+
+Run it against a scratch database, it seeds data and drops/re-creates
+indexes:
+
+    python benchmarks/loan_indexes.py --loans 1000000 --customers 50000
+    python benchmarks/loan_indexes.py --skip-seed --output indexes.json
+
+On PostgreSQL the plans come from EXPLAIN ANALYZE.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'loan_managaement_system.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.core.management import call_command  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from loan.models import BaseModel, CustomerProfile, Loan  # noqa: E402
+
+INDEXED_MODELS = [BaseModel, CustomerProfile, Loan]
+
+
+def get_queries():
+    """
+    The access patterns of LoanModelViewSet, CustomerModelViewSet and
+    LoanAdmin
+    """
+    now = timezone.now()
+    customer_id = Loan.objects.values_list('customer_id', flat=True).first()
+    # A cursor a few thousand rows deep
+    cursor = next(iter(
+        Loan.objects.order_by('created', 'id').values('created', 'id')[5000:5001]
+    ), {'created': now, 'id': 0})
+    return {
+        'approval_queue': Loan.objects.filter(status='new').order_by('id')[:25],
+        'customer_loans_by_status': Loan.objects.filter(
+            customer_id=customer_id, status='approved'
+        ),
+        'maturing_this_quarter': Loan.objects.filter(
+            end_date__gte=now, end_date__lt=now + timedelta(days=91)
+        ).order_by('created', 'id')[:25],
+        'started_last_month': Loan.objects.filter(
+            start_date__gte=now - timedelta(days=30), start_date__lt=now
+        ).order_by('created', 'id')[:25],
+        'tenure_and_status': Loan.objects.filter(
+            tenure=12, status='approved'
+        ).order_by('created', 'id')[:25],
+        'admin_changelist': Loan.objects.order_by('-modified')[:100],
+        'keyset_page': Loan.objects.filter(
+            created__gt=cursor['created']
+        ).order_by('created', 'id')[:26],
+        'customers_by_location': CustomerProfile.objects.filter(
+            country='IN', city='noida'
+        )[:100],
+    }
+
+
+def set_indexes(create):
+    with connection.schema_editor() as editor:
+        for model in INDEXED_MODELS:
+            for index in model._meta.indexes:
+                if create:
+                    editor.add_index(model, index)
+                else:
+                    editor.remove_index(model, index)
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+
+def measure(repeat):
+    results = {}
+    for name, queryset in get_queries().items():
+        timings = []
+        for i in range(repeat):
+            start = time.perf_counter()
+            list(queryset.all())
+            timings.append((time.perf_counter() - start) * 1000)
+        if connection.vendor == 'postgresql':
+            plan = queryset.explain(analyze=True)
+        else:
+            plan = queryset.explain()
+        results[name] = {
+            'median_ms': round(statistics.median(timings), 3),
+            'max_ms': round(max(timings), 3),
+            'plan': plan.splitlines(),
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--loans', type=int, default=1000000)
+    parser.add_argument('--customers', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--skip-seed', action='store_true')
+    parser.add_argument('--output', help="Write the JSON report to a file")
+    args = parser.parse_args()
+
+    if not args.skip_seed:
+        call_command(
+            'seed_loans', customers=args.customers, loans=args.loans, seed=1
+        )
+
+    report = {
+        'vendor': connection.vendor,
+        'loans': Loan.objects.count(),
+        'customers': CustomerProfile.objects.count(),
+    }
+    set_indexes(create=False)
+    try:
+        report['before'] = measure(args.repeat)
+    finally:
+        set_indexes(create=True)
+    report['after'] = measure(args.repeat)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
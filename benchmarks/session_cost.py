@@ -0,0 +1,115 @@
+"""
+Per-request cost of the session with each SESSION_MODE: latency and
+queries of SessionMiddleware for a page view that only reads the session
+(the logged in user's id) and for one that changes it (e.g. a flash
+message), as an agent's page views do.
+
+The database mode is the cost before SESSION_MODE, cached_db and
+signed_cookies the cost after. Run it against a scratch database, the
+sessions it creates are deleted at the end:
+
+    python benchmarks/session_cost.py --requests 2000
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'loan_managaement_system.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from importlib import import_module  # noqa: E402
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth import SESSION_KEY  # noqa: E402
+from django.contrib.sessions.middleware import SessionMiddleware  # noqa: E402
+from django.db import connection, reset_queries  # noqa: E402
+from django.http import HttpResponse  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+from django.test.utils import CaptureQueriesContext, override_settings  # noqa: E402
+
+MODES = ['db', 'cached_db', 'signed_cookies']
+
+
+def measure(call, requests):
+    latencies = []
+    queries = 0
+    for number in range(requests):
+        # The query log keeps 9000 queries, counts stop growing past them
+        reset_queries()
+        with CaptureQueriesContext(connection) as captured:
+            start = time.perf_counter()
+            call()
+            latencies.append((time.perf_counter() - start) * 1000)
+        queries += len(captured)
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        'p50_ms': round(quantiles[49], 3),
+        'p95_ms': round(quantiles[94], 3),
+        'p99_ms': round(quantiles[98], 3),
+        'queries_per_request': round(queries / requests, 2),
+    }
+
+
+def read_view(request):
+    assert request.session[SESSION_KEY]
+    return HttpResponse()
+
+
+def write_view(request):
+    request.session['last_page'] = request.path
+    return read_view(request)
+
+
+def run(mode, requests):
+    engine = 'django.contrib.sessions.backends.%s' % mode
+    with override_settings(SESSION_ENGINE=engine):
+        store = import_module(engine).SessionStore()
+        store[SESSION_KEY] = '1'
+        store.save()
+        cookie = '%s=%s' % (settings.SESSION_COOKIE_NAME, store.session_key)
+        factory = RequestFactory()
+
+        def page_view(view):
+            middleware = SessionMiddleware(view)
+            return lambda: middleware(factory.get('/', HTTP_COOKIE=cookie))
+
+        try:
+            # Warm up the code paths, and the cache of cached_db
+            page_view(read_view)()
+            return {
+                'read': measure(page_view(read_view), requests),
+                'write': measure(page_view(write_view), requests),
+            }
+        finally:
+            store.delete()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--output', help="Write the JSON report to a file")
+    args = parser.parse_args()
+
+    report = {
+        'vendor': connection.vendor,
+        'cache': settings.CACHES['default']['BACKEND'],
+        'requests': args.requests,
+        'modes': {mode: run(mode, args.requests) for mode in MODES},
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Signups per second through NewUserForm, password hashing included.
+
+Every thread acts as one worker thread of the web server and signs up
+customers and agents one after the other. Run it against a scratch
+database, the users it creates are deleted at the end:
+
+    python benchmarks/signups.py --signups 400 --threads 8
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'loan_managaement_system.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection, connections  # noqa: E402
+
+from loan.forms import NewUserForm  # noqa: E402
+from loan.models import User  # noqa: E402
+
+
+def signup(prefix, number):
+    start = time.perf_counter()
+    form = NewUserForm({
+        'first_name': 'Bench', 'last_name': str(number),
+        'username': '%s%d' % (prefix, number),
+        'email': '%s%d@example.com' % (prefix, number),
+        'password1': 'correct-horse-%d' % number,
+        'password2': 'correct-horse-%d' % number,
+        'role': 'agent' if number % 5 == 0 else 'customer',
+        'phone': 9000000000 + number, 'street_address': 'Main Street',
+        'zip_code': '110001', 'city': 'delhi', 'country': 'IN',
+    })
+    if not form.is_valid():
+        raise ValueError(form.errors.as_json())
+    form.save()
+    return (time.perf_counter() - start) * 1000
+
+
+def run(signups, threads):
+    prefix = 'bench-%s-' % uuid.uuid4().hex[:8]
+
+    def task(number):
+        try:
+            return signup(prefix, number)
+        finally:
+            # Each thread has its own connection, closed after every signup
+            # like at the end of a request
+            connections.close_all()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        latencies = sorted(pool.map(task, range(signups)))
+    elapsed = time.perf_counter() - start
+
+    User.objects.filter(username__startswith=prefix).delete()
+    quantiles = statistics.quantiles(latencies, n=100)
+    cores = min(threads, os.cpu_count())
+    return {
+        'signups_per_second': round(signups / elapsed, 2),
+        'signups_per_second_per_core': round(signups / elapsed / cores, 2),
+        'p50_ms': round(quantiles[49], 1),
+        'p95_ms': round(quantiles[94], 1),
+        'p99_ms': round(quantiles[98], 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--signups', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=os.cpu_count())
+    parser.add_argument('--output', help="Write the JSON report to a file")
+    args = parser.parse_args()
+
+    report = {
+        'vendor': connection.vendor,
+        'cpus': os.cpu_count(),
+        'threads': args.threads,
+        'signups': args.signups,
+        **run(args.signups, args.threads),
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,4 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 
 from .models import Loan, User, CustomerProfile
 
@@ -10,7 +10,10 @@ class LoanAdmin(admin.ModelAdmin):
         'customer', 'amount', 'loan_type', 'tenure', 'interest_rate',
         'status', "emi", "amount_paid"
     )
-    readonly_fields = ("emi", "start_date", "end_date", "principal_amount")
+    readonly_fields = (
+        "emi", "start_date", "end_date", "principal_amount", "financed_amount"
+    )
+    actions = ["approve_loans", "reject_loans"]
     
     def has_view_permission(self, request, obj=None):
         if request.user.is_agent or request.user.is_admin():
@@ -20,9 +23,39 @@ class LoanAdmin(admin.ModelAdmin):
         if obj and not request.user.is_admin:
             return self.readonly_fields + ('status')
         elif obj and obj.status == "approved":
-            return [field.name for field in self.model._meta.get_fields() if field.name != 'amount_paid']
+            return [field.name for field in self.model._meta.concrete_fields if field.name != 'amount_paid']
         return self.readonly_fields
 
+    @admin.action(description="Approve selected loans")
+    def approve_loans(self, request, queryset):
+        self.review_loans(request, queryset, "approved")
+
+    @admin.action(description="Reject selected loans")
+    def reject_loans(self, request, queryset):
+        self.review_loans(request, queryset, "rejected")
+
+    # Approval and rejection are done in bulk by LoanQuerySet
+    def review_loans(self, request, queryset, outcome):
+        if not request.user.is_admin():
+            self.message_user(
+                request, "Only admin can approve or reject loans.",
+                messages.ERROR
+            )
+            return
+        if outcome == "approved":
+            changed, skipped = queryset.approve()
+        else:
+            changed, skipped = queryset.reject()
+        self.message_user(request, "%d loans %s." % (len(changed), outcome))
+        if skipped:
+            self.message_user(
+                request,
+                "%d loans were skipped as they were already reviewed: %s" % (
+                    len(skipped), ", ".join(str(pk) for pk in sorted(skipped))
+                ),
+                messages.WARNING
+            )
+
 admin.site.register(Loan, LoanAdmin)
 admin.site.register(User)
 admin.site.register(CustomerProfile)
\ No newline at end of file
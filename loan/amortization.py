@@ -0,0 +1,138 @@
+"""
+EMI and amortization schedules for many loans at once.
+
+Every function takes array-likes of principal, annual interest rate (in
+percent, like Loan.interest_rate) and tenure (months), one entry per loan,
+and computes with NumPy float64 arrays instead of looping over Loan objects.
+Rounded to cents with to_cents() the flat EMIs match Loan.calculate_emi.
+
+Two methods are supported:
+
+* FLAT, what Loan.calculate_emi does: simple interest on the full principal
+  for the whole tenure, repaid in equal installments.
+* REDUCING, the usual annuity: interest is charged monthly on the balance
+  still outstanding.
+"""
+import numpy as np
+from django.db.models.functions import Coalesce
+
+FLAT = 'flat'
+REDUCING = 'reducing'
+METHODS = (FLAT, REDUCING)
+
+
+def as_arrays(principal, rate, tenure):
+    return np.broadcast_arrays(
+        np.atleast_1d(np.asarray(principal, dtype=np.float64)),
+        np.atleast_1d(np.asarray(rate, dtype=np.float64)),
+        np.atleast_1d(np.asarray(tenure, dtype=np.int64)),
+    )
+
+
+def to_cents(values):
+    return np.round(values, 2)
+
+
+def flat_emi(principal, rate, tenure):
+    """
+    Loan.calculate_emi for arrays of loans
+    """
+    principal, rate, tenure = as_arrays(principal, rate, tenure)
+    interest = principal * rate * tenure / (12 * 100)
+    return (principal + interest) / tenure
+
+
+def reducing_emi(principal, rate, tenure):
+    """
+    Installment that repays principal and monthly interest on the
+    outstanding balance in tenure equal payments
+    """
+    principal, rate, tenure = as_arrays(principal, rate, tenure)
+    monthly = rate / (12 * 100)
+    growth = (1 + monthly) ** tenure
+    with np.errstate(divide='ignore', invalid='ignore'):
+        emi = principal * monthly * growth / (growth - 1)
+    return np.where(monthly == 0, principal / tenure, emi)
+
+
+def emi(principal, rate, tenure, method=FLAT):
+    if method == FLAT:
+        return flat_emi(principal, rate, tenure)
+    if method == REDUCING:
+        return reducing_emi(principal, rate, tenure)
+    raise ValueError("Unknown method %r, expected one of %s" % (method, METHODS))
+
+
+def schedule(principal, rate, tenure, method=FLAT):
+    """
+    Month by month schedule of every loan.
+
+    Returns a dict of (loans x longest tenure) arrays: 'emi', 'interest' and
+    'principal' (the split of each installment) and 'balance' (principal
+    outstanding after the installment). Months after a loan's tenure are 0.
+    """
+    principal, rate, tenure = as_arrays(principal, rate, tenure)
+    months = np.arange(1, tenure.max() + 1)
+    active = months <= tenure[:, None]
+    installment = emi(principal, rate, tenure, method)[:, None]
+    start = principal[:, None]
+
+    if method == FLAT:
+        interest = np.broadcast_to(
+            start * rate[:, None] / (12 * 100), active.shape
+        )
+        balance = start - start / tenure[:, None] * months
+    else:
+        monthly = (rate / (12 * 100))[:, None]
+        balance = remaining_balance(start, monthly, installment, months)
+        interest = remaining_balance(start, monthly, installment, months - 1) * monthly
+
+    # The last installment clears the loan, whatever the float rounding
+    balance = np.where(months >= tenure[:, None], 0.0, balance)
+    return {
+        'emi': np.where(active, installment, 0.0),
+        'interest': np.where(active, interest, 0.0),
+        'principal': np.where(active, installment - interest, 0.0),
+        'balance': np.where(active, balance, 0.0),
+    }
+
+
+def remaining_balance(principal, monthly, installment, months):
+    """
+    Balance of an annuity after the given number of installments
+    """
+    growth = (1 + monthly) ** months
+    with np.errstate(divide='ignore', invalid='ignore'):
+        balance = principal * growth - installment * (growth - 1) / monthly
+    return np.where(monthly == 0, principal - installment * months, balance)
+
+
+def loan_arrays(queryset):
+    """
+    ids, principal, rate and tenure of the loans in a queryset. Loans that
+    are not approved yet use their requested amount as principal.
+    """
+    rows = np.array(
+        list(queryset.order_by().values_list(
+            'id', Coalesce('principal_amount', 'amount'), 'interest_rate',
+            'tenure',
+        )),
+        dtype=np.float64,
+    ).reshape(-1, 4)
+    return (
+        rows[:, 0].astype(np.int64), rows[:, 1], rows[:, 2],
+        rows[:, 3].astype(np.int64),
+    )
+
+
+def backtest_rate_change(queryset, rate_change, method=FLAT):
+    """
+    EMIs of every loan in the queryset at the current interest rate and at
+    the rate moved by rate_change percentage points, in one pass
+    """
+    ids, principal, rate, tenure = loan_arrays(queryset)
+    return {
+        'id': ids,
+        'emi': emi(principal, rate, tenure, method),
+        'new_emi': emi(principal, rate + rate_change, tenure, method),
+    }
@@ -0,0 +1,173 @@
+"""
+Read only loan and customer endpoints as native async views, for the mobile
+app's many slow connections. They are served under api/async/ by any ASGI
+server, e.g.
+
+    uvicorn loan_managaement_system.asgi:application
+
+and answer the same JSON as the GET list and detail routes of
+api/loan-requests/ and api/customers/, with the same role scoping, filters
+and keyset pages.
+
+Django 3.2 has no async ORM, so the session lookup with the role of the
+user and the queries of a view are awaited as sync_to_async calls. A
+thread is only borrowed while they run, not while the request is read or
+the response is written to a slow client. Signed tokens
+(loan.authentication) are checked on the event loop.
+"""
+import functools
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import get_user
+from django.http import HttpResponse, HttpResponseNotAllowed
+from django_filters.filterset import filterset_factory
+from rest_framework import exceptions
+from rest_framework.authentication import get_authorization_header
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from .authentication import get_token, read_token, user_from_claims
+from .filters import LoanFilter
+from .models import CustomerProfile, Loan
+from .pagination import KeysetPagination
+from .serializers import CustomerLoanSerializer, CustomerSerializer, LoanSerializer
+from .views import visible_customers, visible_loans
+
+# Roles allowed to read loans, as CanEditLoanRequest. Customers are
+# readable by every authenticated user, as IsOwnerOrAdmin.
+LOAN_READERS = ("admin", "agent", "customer")
+
+CustomerFilter = filterset_factory(CustomerProfile, fields=['city', 'country'])
+
+
+def render(data, status=200):
+    return HttpResponse(
+        JSONRenderer().render(data), status=status,
+        content_type='application/json'
+    )
+
+
+def api_view(view):
+    """
+    GET only, with API errors rendered like DRF's exception handler
+    """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != "GET":
+            return HttpResponseNotAllowed(["GET"])
+        try:
+            return render(await view(request, *args, **kwargs))
+        except exceptions.APIException as exc:
+            data = exc.detail
+            if not isinstance(data, (list, dict)):
+                data = {'detail': data}
+            status = exc.status_code
+            if isinstance(exc, (
+                exceptions.NotAuthenticated, exceptions.AuthenticationFailed
+            )):
+                # Like DRF, session authentication comes first and has no
+                # 401 challenge
+                status = 403
+            return render(data, status=status)
+    return wrapper
+
+
+@sync_to_async
+def session_user(request):
+    """
+    User of the session and their role. AuthenticationMiddleware loads
+    request.user lazily, which can not query from the event loop.
+    """
+    user = get_user(request)
+    request.user = user
+    return user, user.role if user.is_authenticated else None
+
+
+async def authenticate(request):
+    token = get_token(get_authorization_header(request))
+    if token is None:
+        return await session_user(request)
+    # The claims are all the permission checks need, no query is made
+    user = user_from_claims(read_token(token))
+    request.user = user
+    return user, user.role
+
+
+async def check_permission(request, roles=None):
+    user, role = await authenticate(request)
+    if not user.is_authenticated:
+        raise exceptions.NotAuthenticated()
+    if roles is not None and role not in roles:
+        raise exceptions.PermissionDenied()
+    return user, role
+
+
+def loan_serializer(role):
+    if role == "customer":
+        return CustomerLoanSerializer
+    return LoanSerializer
+
+
+def loans(user):
+    return visible_loans(Loan.objects.select_related('customer__user'), user)
+
+
+def customers(user):
+    return visible_customers(CustomerProfile.objects.select_related('user'), user)
+
+
+def filtered(filterset_class, request, queryset):
+    filterset = filterset_class(request.GET, queryset=queryset, request=request)
+    if not filterset.is_valid():
+        raise exceptions.ValidationError(filterset.errors)
+    return filterset.qs
+
+
+def paginate(request, queryset, serializer_class):
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(queryset, Request(request))
+    data = serializer_class(page, many=True).data
+    return paginator.get_paginated_response(data).data
+
+
+def detail(queryset, pk, serializer_class):
+    try:
+        return serializer_class(queryset.get(pk=pk)).data
+    except queryset.model.DoesNotExist:
+        raise exceptions.NotFound()
+
+
+@sync_to_async
+def loan_page(request, user, role):
+    queryset = filtered(LoanFilter, request, loans(user))
+    return paginate(request, queryset, loan_serializer(role))
+
+
+@sync_to_async
+def customer_page(request, user):
+    queryset = filtered(CustomerFilter, request, customers(user))
+    return paginate(request, queryset, CustomerSerializer)
+
+
+@api_view
+async def loan_list(request):
+    user, role = await check_permission(request, LOAN_READERS)
+    return await loan_page(request, user, role)
+
+
+@api_view
+async def loan_detail(request, pk):
+    user, role = await check_permission(request, LOAN_READERS)
+    return await sync_to_async(detail)(loans(user), pk, loan_serializer(role))
+
+
+@api_view
+async def customer_list(request):
+    user, role = await check_permission(request)
+    return await customer_page(request, user)
+
+
+@api_view
+async def customer_detail(request, pk):
+    user, role = await check_permission(request)
+    return await sync_to_async(detail)(customers(user), pk, CustomerSerializer)
@@ -0,0 +1,102 @@
+"""
+Stateless signed tokens for API clients.
+
+A token carries the user's id, username and role flags, signed with
+SECRET_KEY (django.core.signing, HMAC-SHA256) and timestamped. It is sent
+as ``Authorization: Bearer <token>`` and checked without touching the
+database: the request user is built from the claims. Tokens expire after
+API_TOKEN_MAX_AGE seconds, so a changed role or a deactivated user takes
+effect at the latest when the client refreshes its token, which reloads
+the user.
+"""
+from django.conf import settings
+from django.core import signing
+from rest_framework import exceptions
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+
+from .models import User
+
+TOKEN_SALT = "loan.authentication.token"
+KEYWORD = "Bearer"
+
+
+def make_token(user):
+    return signing.dumps({
+        "id": user.pk,
+        "username": user.username,
+        "role": user.role,
+        "admin": user.is_admin(),
+        "agent": user.is_agent,
+        "customer": user.is_customer,
+    }, salt=TOKEN_SALT)
+
+
+def token_response(user):
+    return {
+        "token": make_token(user),
+        "expires_in": settings.API_TOKEN_MAX_AGE,
+        "role": user.role,
+    }
+
+
+def read_token(token):
+    """
+    Claims of a token, raises AuthenticationFailed if it is forged or has
+    expired
+    """
+    try:
+        return signing.loads(
+            token, salt=TOKEN_SALT, max_age=settings.API_TOKEN_MAX_AGE
+        )
+    except signing.SignatureExpired:
+        raise exceptions.AuthenticationFailed("Token has expired.")
+    except signing.BadSignature:
+        raise exceptions.AuthenticationFailed("Invalid token.")
+
+
+def user_from_claims(claims):
+    """
+    An unsaved-looking User with the fields the permission checks read.
+    Anything else, such as user.customer, is loaded on first access.
+    """
+    user = User(
+        id=claims["id"], username=claims["username"], is_active=True,
+        is_agent=claims["agent"], is_customer=claims["customer"],
+    )
+    user._state.adding = False
+    user._in_admin_group = claims["admin"]
+    return user
+
+
+def get_token(header):
+    """
+    Token of an Authorization header, None if it is not a Bearer header
+    """
+    parts = header.split()
+    if not parts or parts[0].lower() != KEYWORD.lower().encode():
+        return None
+    if len(parts) != 2:
+        raise exceptions.AuthenticationFailed(
+            "Invalid token header, expected 'Bearer <token>'."
+        )
+    try:
+        return parts[1].decode("ascii")
+    except UnicodeError:
+        raise exceptions.AuthenticationFailed("Invalid token.")
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """
+    Authorization: Bearer <token> with tokens from POST api/token/. Unlike
+    session authentication no CSRF token is needed.
+    """
+    def authenticate(self, request):
+        token = get_token(get_authorization_header(request))
+        if token is None:
+            return None
+        claims = read_token(token)
+        return user_from_claims(claims), claims
+
+    def authenticate_header(self, request):
+        return KEYWORD
+
@@ -0,0 +1,135 @@
+"""
+Cache of rendered list and retrieve responses, per user and per URL.
+
+Every model shown by a response has a version in the cache, which is part
+of the response keys. Saving or deleting a row of the model bumps the
+version (see loan.signals, and invalidate() for the paths that send no
+signals), so every cached response that could show the row is skipped at
+once and then expires. The user's role is part of the key as well, a user
+whose role changes gets fresh responses.
+
+Responses are only cached with SHARED_CACHE: with a per process cache a
+change would only bump the versions of the process that made it, and the
+other workers would keep serving stale lists.
+
+Hits and misses are counted in the cache, see stats() and
+manage.py response_cache_stats.
+"""
+import functools
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.http import HttpResponse
+from django.template.response import SimpleTemplateResponse
+
+HITS_KEY = "loan:response:hits"
+MISSES_KEY = "loan:response:misses"
+
+
+def version_key(model):
+    return "loan:response:version:%s" % model._meta.label_lower
+
+
+def versions(models):
+    keys = [version_key(model) for model in models]
+    found = cache.get_many(keys)
+    for key in set(keys) - set(found):
+        # A new version starts from the clock, so a version that was evicted
+        # can not come back to match responses cached before the eviction
+        cache.add(key, time.time_ns(), None)
+        found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def bump(model):
+    try:
+        cache.incr(version_key(model))
+    except ValueError:
+        cache.add(version_key(model), time.time_ns(), None)
+
+
+def invalidate(model, using=None):
+    """
+    Skips the cached responses that show model. Inside a transaction the
+    version is bumped again on commit, since a response rendered before the
+    commit can only have seen the old rows.
+    """
+    bump(model)
+    if connections[using or 'default'].in_atomic_block:
+        transaction.on_commit(lambda: bump(model), using=using)
+
+
+def count(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, None)
+
+
+def stats():
+    counts = cache.get_many([HITS_KEY, MISSES_KEY])
+    hits, misses = counts.get(HITS_KEY, 0), counts.get(MISSES_KEY, 0)
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / (hits + misses), 4) if hits + misses else None,
+    }
+
+
+def reset_stats():
+    cache.delete_many([HITS_KEY, MISSES_KEY])
+
+
+def response_key(request, models):
+    user = request.user
+    url = hashlib.md5(request.build_absolute_uri().encode('utf-8')).hexdigest()
+    return "loan:response:page:%s:%s:%s:%s:%s" % (
+        ".".join(str(version) for version in versions(models)),
+        user.pk, user.role, request.accepted_renderer.format, url,
+    )
+
+
+def cached_response(*models):
+    """
+    Caches the rendered responses of a viewset's list or retrieve, with
+    their headers, for RESPONSE_CACHE_TIMEOUT seconds. Only 200 responses
+    are kept, and not pages with a CSRF token, which changes with the
+    session.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            timeout = settings.RESPONSE_CACHE_TIMEOUT
+            if not timeout or not settings.SHARED_CACHE or \
+                    request.method != 'GET' or not request.user.is_authenticated:
+                return method(self, request, *args, **kwargs)
+
+            key = response_key(request, models)
+            cached = cache.get(key)
+            if cached is not None:
+                count(HITS_KEY)
+                content, headers = cached
+                response = HttpResponse(content)
+                for header, value in headers:
+                    response[header] = value
+                response['X-Cache'] = 'HIT'
+                return response
+
+            count(MISSES_KEY)
+            response = method(self, request, *args, **kwargs)
+            if not isinstance(response, SimpleTemplateResponse):
+                return response
+
+            def store(response):
+                if response.status_code == 200 and \
+                        not request.META.get('CSRF_COOKIE_USED'):
+                    cache.set(key, (response.content, list(response.items())), timeout)
+
+            response['X-Cache'] = 'MISS'
+            response.add_post_render_callback(store)
+            return response
+        return wrapper
+    return decorator
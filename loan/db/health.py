@@ -0,0 +1,42 @@
+class HealthCheckMixin:
+    """
+    CONN_HEALTH_CHECKS of Django 4.1 for the Django 3.2 backends.
+
+    A connection kept from an earlier request (CONN_MAX_AGE) is tested with
+    is_usable() before the first query of the next request and reopened if
+    the server dropped it in the meantime, instead of failing the request.
+    """
+    health_check_done = False
+
+    @property
+    def health_check_enabled(self):
+        return self.settings_dict.get('CONN_HEALTH_CHECKS', False)
+
+    def connect(self):
+        super().connect()
+        # A new connection needs no check
+        self.health_check_done = True
+
+    def close_if_unusable_or_obsolete(self):
+        # Runs when a request starts and finishes
+        if self.connection is not None:
+            self.health_check_done = False
+        super().close_if_unusable_or_obsolete()
+
+    def close_if_health_check_failed(self):
+        if self.connection is None or not self.health_check_enabled or \
+                self.health_check_done:
+            return
+        if not self.is_usable():
+            self.close()
+        self.health_check_done = True
+
+    def set_autocommit(self, *args, **kwargs):
+        # transaction.atomic() may be the first use in a request
+        self.validate_no_atomic_block()
+        self.close_if_health_check_failed()
+        return super().set_autocommit(*args, **kwargs)
+
+    def _cursor(self, name=None):
+        self.close_if_health_check_failed()
+        return super()._cursor(name)
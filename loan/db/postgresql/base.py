@@ -0,0 +1,86 @@
+"""
+PostgreSQL with health checks and a connection pool, ENGINE
+'loan.db.postgresql'.
+
+With POOL_SIZE set, each process keeps up to that many connections per
+database in a psycopg2 ThreadedConnectionPool, opened on first use.
+Closing a Django connection (after every request with CONN_MAX_AGE = 0,
+or once it is older than CONN_MAX_AGE) hands it back to the pool instead
+of closing the socket, so the next request on any thread skips the TCP
+and authentication handshake. When every pooled connection is taken, a
+connection is opened outside of the pool and closed afterwards.
+"""
+import threading
+
+import psycopg2.extras
+from django.db.backends.postgresql import base
+from psycopg2 import pool as psycopg2_pool
+
+from ..health import HealthCheckMixin
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, size, conn_params):
+    with _pools_lock:
+        if alias not in _pools:
+            # Connections above minconn are closed when they are handed back
+            _pools[alias] = psycopg2_pool.ThreadedConnectionPool(
+                size, size, **conn_params
+            )
+        return _pools[alias]
+
+
+def is_usable(connection):
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        if not connection.autocommit:
+            connection.rollback()
+    except base.Database.Error:
+        return False
+    return True
+
+
+class DatabaseWrapper(HealthCheckMixin, base.DatabaseWrapper):
+    pool = None
+
+    def get_new_connection(self, conn_params):
+        size = self.settings_dict.get('POOL_SIZE')
+        self.pool = None
+        if not size:
+            return super().get_new_connection(conn_params)
+
+        pool = get_pool(self.alias, size, conn_params)
+        try:
+            connection = pool.getconn()
+        except psycopg2_pool.PoolError:
+            # Every pooled connection is in use
+            return super().get_new_connection(conn_params)
+        if self.health_check_enabled and not is_usable(connection):
+            pool.putconn(connection, close=True)
+            return self.get_new_connection(conn_params)
+        self.pool = pool
+
+        # The setup of base.DatabaseWrapper.get_new_connection, which is
+        # kept by pooled connections but not by this wrapper
+        options = self.settings_dict['OPTIONS']
+        try:
+            self.isolation_level = options['isolation_level']
+        except KeyError:
+            self.isolation_level = connection.isolation_level
+        else:
+            if self.isolation_level != connection.isolation_level:
+                connection.set_session(isolation_level=self.isolation_level)
+        psycopg2.extras.register_default_jsonb(conn_or_curs=connection, loads=lambda x: x)
+        return connection
+
+    def _close(self):
+        if self.connection is None or self.pool is None:
+            return super()._close()
+        pool, self.pool = self.pool, None
+        with self.wrap_database_errors:
+            # The pool rolls back an open transaction, broken connections
+            # are dropped
+            pool.putconn(self.connection, close=bool(self.connection.closed))
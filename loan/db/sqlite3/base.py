@@ -0,0 +1,18 @@
+"""
+SQLite with the health checks of loan.db.postgresql, ENGINE
+'loan.db.sqlite3'. Two database files stand in for a primary and a
+replica when trying the connection settings without PostgreSQL.
+"""
+from django.db.backends.sqlite3 import base
+
+from ..health import HealthCheckMixin
+
+
+class DatabaseWrapper(HealthCheckMixin, base.DatabaseWrapper):
+    def is_usable(self):
+        # Django's SQLite backend takes every connection to be usable
+        try:
+            self.connection.execute('SELECT 1')
+        except base.Database.Error:
+            return False
+        return True
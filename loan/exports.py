@@ -0,0 +1,82 @@
+"""
+Streaming CSV / NDJSON dumps of loans and customers.
+
+Rows are read with values_list().iterator(chunk_size), which uses a
+server-side cursor on PostgreSQL, and turned into lines one at a time, so
+memory stays flat however many rows are exported. No model instances are
+built along the way.
+"""
+import csv
+import datetime
+import json
+from decimal import Decimal
+
+from django.conf import settings
+
+CSV = 'csv'
+NDJSON = 'ndjson'
+CONTENT_TYPES = {CSV: 'text/csv', NDJSON: 'application/x-ndjson'}
+
+# (column, queryset lookup)
+LOAN_COLUMNS = [
+    ('id', 'id'), ('customer', 'customer_id'), ('loan_type', 'loan_type'),
+    ('amount', 'amount'), ('tenure', 'tenure'),
+    ('interest_rate', 'interest_rate'), ('emi', 'emi'),
+    ('start_date', 'start_date'), ('end_date', 'end_date'),
+    ('principal_amount', 'principal_amount'), ('status', 'status'),
+    ('amount_paid', 'amount_paid'), ('no_of_emi_left', 'no_of_emi_left'),
+    ('created', 'created'), ('modified', 'modified'),
+]
+
+CUSTOMER_COLUMNS = [
+    ('id', 'id'), ('user', 'user_id'), ('username', 'user__username'),
+    ('first_name', 'user__first_name'), ('last_name', 'user__last_name'),
+    ('email', 'user__email'), ('phone', 'phone'),
+    ('street_address', 'street_address'), ('zip_code', 'zip_code'),
+    ('city', 'city'), ('country', 'country'),
+    ('created', 'created'), ('modified', 'modified'),
+]
+
+
+def encode(value):
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def rows(queryset, columns, chunk_size=None):
+    queryset = queryset.order_by('pk').values_list(
+        *[lookup for column, lookup in columns]
+    )
+    return queryset.iterator(chunk_size=chunk_size or settings.EXPORT_CHUNK_SIZE)
+
+
+class Echo:
+    """
+    File-like object for csv.writer that hands back each written line
+    """
+    def write(self, value):
+        return value
+
+
+def csv_lines(queryset, columns, chunk_size=None):
+    writer = csv.writer(Echo())
+    yield writer.writerow([column for column, lookup in columns])
+    for row in rows(queryset, columns, chunk_size):
+        yield writer.writerow(['' if value is None else encode(value) for value in row])
+
+
+def ndjson_lines(queryset, columns, chunk_size=None):
+    names = [column for column, lookup in columns]
+    for row in rows(queryset, columns, chunk_size):
+        yield json.dumps(dict(zip(names, map(encode, row)))) + '\n'
+
+
+def lines(kind, queryset, columns, chunk_size=None):
+    if kind == CSV:
+        return csv_lines(queryset, columns, chunk_size)
+    if kind == NDJSON:
+        return ndjson_lines(queryset, columns, chunk_size)
+    raise ValueError("Unknown export type %r, expected %s or %s" % (kind, CSV, NDJSON))
@@ -0,0 +1,74 @@
+import datetime
+
+import django_filters
+from django.utils import timezone
+
+from .models import DailySummary, Loan
+
+
+def start_of_day(day):
+    return timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+
+
+#Loan filters
+class LoanFilter(django_filters.FilterSet):
+    """
+    Date filters take a day and are turned into half-open ranges on the
+    timestamp, e.g. start_date_before=2021-05-31 becomes
+    start_date < 2021-06-01 00:00. The column is compared as it is stored,
+    so the database can use an index instead of casting every row to a date.
+
+    start_date / end_date match a single day, *_after and *_before are
+    inclusive of the given day.
+    """
+    start_date = django_filters.DateFilter(method='filter_on_day')
+    start_date_after = django_filters.DateFilter(
+        field_name='start_date', method='filter_from_day'
+    )
+    start_date_before = django_filters.DateFilter(
+        field_name='start_date', method='filter_until_day'
+    )
+    end_date = django_filters.DateFilter(method='filter_on_day')
+    end_date_after = django_filters.DateFilter(
+        field_name='end_date', method='filter_from_day'
+    )
+    end_date_before = django_filters.DateFilter(
+        field_name='end_date', method='filter_until_day'
+    )
+
+    class Meta:
+        model = Loan
+        fields = ['tenure', 'status']
+
+    def filter_on_day(self, queryset, name, value):
+        return queryset.filter(**{
+            '%s__gte' % name: start_of_day(value),
+            '%s__lt' % name: start_of_day(value + datetime.timedelta(days=1)),
+        })
+
+    def filter_from_day(self, queryset, name, value):
+        return queryset.filter(**{'%s__gte' % name: start_of_day(value)})
+
+    def filter_until_day(self, queryset, name, value):
+        return queryset.filter(**{
+            '%s__lt' % name: start_of_day(value + datetime.timedelta(days=1))
+        })
+
+
+#Filters of the portfolio reports
+class PortfolioFilter(LoanFilter):
+    country = django_filters.CharFilter(field_name='customer__country')
+
+    class Meta:
+        model = Loan
+        fields = ['tenure', 'status', 'loan_type']
+
+
+#Filters of the daily summary, days are inclusive
+class DailySummaryFilter(django_filters.FilterSet):
+    day_after = django_filters.DateFilter(field_name='day', lookup_expr='gte')
+    day_before = django_filters.DateFilter(field_name='day', lookup_expr='lte')
+
+    class Meta:
+        model = DailySummary
+        fields = ['loan_type', 'status']
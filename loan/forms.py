@@ -1,8 +1,8 @@
 from django.contrib.auth.forms import UserCreationForm
 from django_countries.fields import CountryField
 from django import forms
-from .models import User,CustomerProfile
-from django.contrib.auth.models import Group
+from django.db import transaction
+from .models import AGENT_GROUP, User, CustomerProfile, group_id
 
 
 #New user registration form 
@@ -41,12 +41,16 @@ class NewUserForm(UserCreationForm):
         if user.is_customer:
             user.is_active = True
 
-        if commit:
+        if not commit:
+            return user
+
+        # A user is never left without its group or profile
+        with transaction.atomic():
+            agent_group = group_id(AGENT_GROUP) if user.is_agent else None
             user.save()
 
             if user.is_agent:
-                agent_group = Group.objects.get(name='Agent')
-                agent_group.user_set.add(user)
+                user.groups.add(agent_group)
             # Create customer profile for user
             if user.is_customer:
                 CustomerProfile.objects.create(
@@ -0,0 +1,260 @@
+"""
+Bulk import of a partner's book of customers and loans, for
+manage.py import_book.
+
+Files are read lazily (CSV or NDJSON) and handled in chunks. Every chunk is
+validated with a single serializer, its foreign keys are resolved with one
+query and its rows are inserted with bulk_create / bulk_create_children
+(or COPY on PostgreSQL). The checkpoint is moved in the same transaction,
+so after a failure the import resumes at the first row that was not
+committed.
+
+Password hashing is the slowest step by far. With workers it runs in a
+process pool, one chunk ahead of the chunk being inserted. Next come the
+repayment schedules of approved loans (a dozen installments each), which
+can be left to manage.py extend_schedules with defer_schedules.
+"""
+import csv
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.exceptions import ValidationError
+
+from .bulk import bulk_create_children, copy_create
+from .models import (
+    CustomerProfile, DailySummary, ImportCheckpoint, Installment, Loan, User,
+    schedule_horizon,
+)
+from .serializers import ImportCustomerSerializer, ImportLoanSerializer
+
+CUSTOMERS = 'customers'
+LOANS = 'loans'
+EXTENSIONS = ('.csv', '.ndjson', '.jsonl')
+
+
+def read_rows(path):
+    """
+    Rows of a .csv or .ndjson / .jsonl file. Empty CSV cells are left out
+    so optional fields take their defaults, NDJSON lines that do not parse
+    are passed on as strings and fail validation.
+    """
+    if os.path.splitext(path)[1].lower() == '.csv':
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                yield {key: value for key, value in row.items() if value not in ('', None)}
+        return
+
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                yield line
+
+
+def chunks(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def setup_worker():
+    # Workers started with spawn instead of fork need their own setup
+    django.setup()
+
+
+class BookImporter:
+    def __init__(self, job, chunk_size=5000, workers=0, copy=False,
+                 defer_schedules=False, on_error=None, on_progress=None):
+        self.job = job
+        self.chunk_size = chunk_size
+        self.copy = copy
+        self.defer_schedules = defer_schedules
+        self.on_error = on_error or (lambda source, row, errors: None)
+        self.on_progress = on_progress or (lambda source, position: None)
+        self.pool = ProcessPoolExecutor(
+            workers, initializer=setup_worker
+        ) if workers else None
+        self.rates = {
+            loan_type: Decimal(rate)
+            for loan_type, rate in settings.INTEREST_RATE.items()
+        }
+        self.counts = {
+            source: {'imported': 0, 'failed': 0} for source in (CUSTOMERS, LOANS)
+        }
+        # Rejected rows of the chunk being processed
+        self.errors = []
+
+    def close(self):
+        if self.pool:
+            self.pool.shutdown()
+
+    def restart(self):
+        ImportCheckpoint.objects.filter(job=self.job).delete()
+
+    def run(self, source, path):
+        """
+        Imports the rows of path after the checkpoint of source
+        """
+        checkpoint, created = ImportCheckpoint.objects.get_or_create(
+            job=self.job, source=source
+        )
+        rows = itertools.islice(read_rows(path), checkpoint.position, None)
+        position = checkpoint.position
+
+        # Chunk n is inserted while the passwords of chunk n + 1 are hashed
+        pending = None
+        for chunk in chunks(rows, self.chunk_size):
+            prepared = (position, chunk, self.prepare(source, chunk))
+            position += len(chunk)
+            if pending:
+                self.process(source, checkpoint, *pending)
+            pending = prepared
+        if pending:
+            self.process(source, checkpoint, *pending)
+        return self.counts[source]
+
+    def prepare(self, source, chunk):
+        if source != CUSTOMERS:
+            return None
+        passwords = [
+            row.get('password') or None if isinstance(row, dict) else None
+            for row in chunk
+        ]
+        if self.pool:
+            return self.pool.map(make_password, passwords, chunksize=64)
+        return map(make_password, passwords)
+
+    def process(self, source, checkpoint, start, chunk, prepared):
+        self.errors = []
+        with transaction.atomic():
+            if source == CUSTOMERS:
+                imported = self.import_customers(start, chunk, prepared)
+            else:
+                imported = self.import_loans(start, chunk)
+            checkpoint.position = start + len(chunk)
+            checkpoint.save(update_fields=['position', 'modified'])
+        # Rejected rows are only reported once their chunk is committed, a
+        # chunk that failed is validated again when the job resumes
+        for error in self.errors:
+            self.counts[source]['failed'] += 1
+            self.on_error(*error)
+        self.counts[source]['imported'] += imported
+        self.on_progress(source, checkpoint.position)
+
+    def error(self, source, row, errors):
+        self.errors.append((source, row, errors))
+
+    def validate(self, source, serializer, start, chunk):
+        valid = []
+        for number, row in enumerate(chunk, start):
+            if not isinstance(row, dict):
+                self.error(source, number, {'non_field_errors': ['Expected an object.']})
+                continue
+            try:
+                valid.append((number, serializer.run_validation(row)))
+            except ValidationError as exc:
+                self.error(source, number, exc.detail)
+        return valid
+
+    def import_customers(self, start, chunk, hashes):
+        valid = self.validate(CUSTOMERS, ImportCustomerSerializer(), start, chunk)
+        hashes = list(hashes)
+        existing = set(User.objects.filter(
+            username__in=[data['username'] for number, data in valid]
+        ).values_list('username', flat=True))
+
+        users = []
+        profiles = []
+        for number, data in valid:
+            if data['username'] in existing:
+                self.error(CUSTOMERS, number, {
+                    'username': ['A user with that username already exists.']
+                })
+                continue
+            existing.add(data['username'])
+            users.append(User(
+                username=data['username'], email=data['email'],
+                first_name=data['first_name'], last_name=data['last_name'],
+                password=hashes[number - start], is_customer=True,
+            ))
+            profiles.append(CustomerProfile(
+                phone=data['phone'], street_address=data['street_address'],
+                zip_code=data['zip_code'], city=data['city'],
+                country=data['country'],
+            ))
+
+        if self.copy:
+            copy_create(User, users)
+        else:
+            User.objects.bulk_create(users)
+            if users and users[0].pk is None:
+                # Not every backend returns ids from bulk_create
+                ids = dict(User.objects.filter(
+                    username__in=[user.username for user in users]
+                ).values_list('username', 'id'))
+                for user in users:
+                    user.pk = ids[user.username]
+        for user, profile in zip(users, profiles):
+            profile.user_id = user.pk
+        self.insert(CustomerProfile, profiles)
+        return len(profiles)
+
+    def import_loans(self, start, chunk):
+        valid = self.validate(LOANS, ImportLoanSerializer(), start, chunk)
+        customers = dict(CustomerProfile.objects.filter(
+            user__username__in={data['customer'] for number, data in valid}
+        ).values_list('user__username', 'id'))
+
+        loans = []
+        for number, data in valid:
+            if data['customer'] not in customers:
+                self.error(LOANS, number, {
+                    'customer': ['Customer %s does not exist.' % data['customer']]
+                })
+                continue
+            loans.append(self.make_loan(customers[data['customer']], data))
+
+        self.insert(Loan, loans)
+        if not self.defer_schedules:
+            # The loans are new, their schedules start at the first
+            # installment and need no lookup
+            horizon = schedule_horizon()
+            Installment.objects.bulk_create([
+                installment for loan in loans if loan.status == 'approved'
+                for installment in loan.make_installments(1, horizon)
+            ], batch_size=1000)
+        # No post_save is sent for the summary
+        DailySummary.add_loans(loans)
+        return len(loans)
+
+    def make_loan(self, customer_id, data):
+        loan = Loan(
+            customer_id=customer_id, loan_type=data['loan_type'],
+            amount=data['amount'], tenure=data['tenure'],
+            interest_rate=data.get('interest_rate', self.rates[data['loan_type']]),
+            status=data.get('status', 'new'), amount_paid=data.get('amount_paid'),
+        )
+        if loan.status == 'approved':
+            # Same fields Loan.save() sets on approval
+            loan.set_approval(data.get('start_date') or timezone.now())
+        return loan
+
+    def insert(self, model, objs):
+        if self.copy:
+            return copy_create(model, objs)
+        return bulk_create_children(model, objs)
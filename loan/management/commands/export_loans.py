@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from loan import exports
+from loan.filters import LoanFilter
+from loan.models import Loan
+
+
+class Command(BaseCommand):
+    help = (
+        "Streams every loan as CSV or NDJSON to a file or stdout. Takes the "
+        "filters of /api/loan-requests/ as --filter name=value, e.g. "
+        "--filter status=approved --filter start_date_after=2021-01-01."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--type', choices=[exports.CSV, exports.NDJSON], default=exports.CSV
+        )
+        parser.add_argument('--output', help="File to write, stdout if omitted")
+        parser.add_argument(
+            '--filter', action='append', default=[], dest='filters',
+            metavar='NAME=VALUE',
+        )
+        parser.add_argument('--chunk-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        data = {}
+        for item in options['filters']:
+            name, sep, value = item.partition('=')
+            if not sep:
+                raise CommandError("Filters are NAME=VALUE, got %r" % item)
+            data[name] = value
+
+        loans = LoanFilter(data, queryset=Loan.objects.all())
+        if not loans.is_valid():
+            raise CommandError(loans.errors.as_json())
+
+        lines = exports.lines(
+            options['type'], loans.qs, exports.LOAN_COLUMNS,
+            options['chunk_size'],
+        )
+        if options['output']:
+            with open(options['output'], 'w', newline='') as f:
+                count = self.write(f.write, lines)
+        else:
+            count = self.write(
+                lambda line: self.stdout.write(line, ending=''), lines
+            )
+        if options['type'] == exports.CSV:
+            count -= 1  # header
+        self.stderr.write("Exported %d loans" % count)
+
+    def write(self, write, lines):
+        count = 0
+        for line in lines:
+            write(line)
+            count += 1
+        return count
@@ -0,0 +1,28 @@
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from loan.models import Loan
+
+
+class Command(BaseCommand):
+    help = (
+        "Generates the repayment installments of approved loans that fall "
+        "due within the next --months-ahead months. Run it daily."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months-ahead', type=int, default=settings.SCHEDULE_MONTHS_AHEAD
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        until = (
+            timezone.now() + relativedelta(months=options['months_ahead'])
+        ).date()
+        created = Loan.objects.extend_schedules(
+            until, batch_size=options['batch_size']
+        )
+        self.stdout.write("Created %d installments due by %s" % (created, until))
@@ -0,0 +1,87 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from loan.imports import CUSTOMERS, EXTENSIONS, LOANS, BookImporter
+
+
+class Command(BaseCommand):
+    help = (
+        "Imports a book of customers and loans from CSV or NDJSON files. "
+        "Customers are imported before loans, which refer to them by "
+        "username. An interrupted import resumes where it stopped when "
+        "run again with the same --job, rejected rows are reported as "
+        "NDJSON to --errors (stderr by default)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', help="CSV or NDJSON file of customers")
+        parser.add_argument('--loans', help="CSV or NDJSON file of loans")
+        parser.add_argument(
+            '--job', help="Name of the checkpoint, the file names by default"
+        )
+        parser.add_argument('--restart', action='store_true',
+                            help="Ignore the checkpoint and start over")
+        parser.add_argument('--chunk-size', type=int, default=5000)
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help="Password hashing processes, 0 hashes in this process"
+        )
+        parser.add_argument('--copy', action='store_true',
+                            help="Insert with COPY, PostgreSQL only")
+        parser.add_argument(
+            '--defer-schedules', action='store_true',
+            help="Skip the installments of approved loans, run "
+                 "extend_schedules afterwards"
+        )
+        parser.add_argument('--errors', help="File for the rejected rows")
+
+    def handle(self, *args, **options):
+        sources = [
+            (source, options[source]) for source in (CUSTOMERS, LOANS)
+            if options[source]
+        ]
+        if not sources:
+            raise CommandError("Nothing to import, pass --customers and/or --loans")
+        for source, path in sources:
+            if os.path.splitext(path)[1].lower() not in EXTENSIONS:
+                raise CommandError("%s must be one of %s" % (path, ", ".join(EXTENSIONS)))
+            if not os.path.exists(path):
+                raise CommandError("%s does not exist" % path)
+        job = options['job'] or "+".join(os.path.basename(path) for source, path in sources)
+
+        errors = open(options['errors'], 'a') if options['errors'] else None
+
+        def on_error(source, row, detail):
+            line = json.dumps({'source': source, 'row': row, 'errors': detail})
+            if errors:
+                errors.write(line + '\n')
+            else:
+                self.stderr.write(line)
+
+        importer = BookImporter(
+            job, chunk_size=options['chunk_size'], workers=options['workers'],
+            copy=options['copy'], defer_schedules=options['defer_schedules'],
+            on_error=on_error,
+            on_progress=lambda source, position: self.stdout.write(
+                "%s: %d rows done" % (source, position)
+            ),
+        )
+        try:
+            if options['restart']:
+                importer.restart()
+            for source, path in sources:
+                counts = importer.run(source, path)
+                self.stdout.write("Imported %d %s, %d rejected" % (
+                    counts['imported'], source, counts['failed']
+                ))
+            if options['defer_schedules'] and options[LOANS]:
+                self.stdout.write(
+                    "Run manage.py extend_schedules to create the installments "
+                    "of the approved loans"
+                )
+        finally:
+            importer.close()
+            if errors:
+                errors.close()
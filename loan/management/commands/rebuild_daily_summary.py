@@ -0,0 +1,25 @@
+import datetime
+
+from django.core.management.base import BaseCommand
+
+from loan.models import DailySummary
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes the daily loan summary from the loans. Loan saves keep "
+        "it up to date, run it after loading data without Loan.save or to "
+        "repair drift."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--day', action='append', dest='days', metavar='YYYY-MM-DD',
+            type=datetime.date.fromisoformat,
+            help="Only rebuild this day, can be repeated"
+        )
+
+    def handle(self, *args, **options):
+        days = options['days'] and set(options['days'])
+        rows = DailySummary.rebuild(days=days)
+        self.stdout.write("Rebuilt %d summary rows" % rows)
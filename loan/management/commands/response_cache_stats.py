@@ -0,0 +1,22 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from loan import caching
+
+
+class Command(BaseCommand):
+    help = (
+        "Prints the hits and misses of the list and detail response cache "
+        "as JSON. Counts are kept in the configured cache, so they are per "
+        "process with the default local memory cache."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true',
+                            help="Start counting again after printing")
+
+    def handle(self, *args, **options):
+        self.stdout.write(json.dumps(caching.stats()))
+        if options['reset']:
+            caching.reset_stats()
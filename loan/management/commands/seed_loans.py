@@ -0,0 +1,158 @@
+import random
+import uuid
+from datetime import timedelta
+from decimal import Decimal
+
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from loan.bulk import bulk_create_children
+from loan.models import CustomerProfile, DailySummary, Loan, User
+
+# (country, city, weight)
+LOCATIONS = [
+    ('IN', 'noida', 30), ('IN', 'delhi', 25), ('IN', 'mumbai', 20),
+    ('IN', 'bengaluru', 15), ('US', 'new york', 4), ('GB', 'london', 3),
+    ('CA', 'toronto', 3),
+]
+
+# loan_type: (weight, median amount, tenures in months)
+LOAN_TYPES = {
+    'home': (25, 250000, [120, 180, 240, 300, 360]),
+    'car': (30, 20000, [12, 24, 36, 48, 60, 72]),
+    'personal': (45, 5000, [6, 12, 18, 24, 36, 48, 60]),
+}
+
+STATUSES = [('new', 30), ('approved', 60), ('rejected', 10)]
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds customers and loans with realistic distributions of loan "
+        "type, amount, tenure and status, for benchmarks and load tests. "
+        "Users are named <prefix><n>, <prefix>agent<n> and <prefix>admin<n>, "
+        "every seeded user has the password 'password'."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--customers', type=int, default=1000)
+        parser.add_argument('--loans', type=int, default=10000)
+        parser.add_argument('--agents', type=int, default=0)
+        parser.add_argument('--admins', type=int, default=0)
+        parser.add_argument(
+            '--prefix', default=None,
+            help="Start of the usernames, random by default. Load tests log "
+                 "in with it, see benchmarks/load_test.py"
+        )
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+        prefix = options['prefix'] or 'seed-%s-' % uuid.uuid4().hex[:8]
+        # One hash for everyone, hashing per user would dominate the run
+        password = make_password('password')
+
+        customer_ids = self.seed_customers(
+            rng, options['customers'], batch_size, prefix, password
+        )
+        self.stdout.write("Created %d customers" % len(customer_ids))
+        self.seed_staff(options['agents'], options['admins'], prefix, password)
+
+        created = 0
+        while created < options['loans']:
+            count = min(batch_size, options['loans'] - created)
+            loans = bulk_create_children(
+                Loan, [self.make_loan(rng, customer_ids) for i in range(count)]
+            )
+            # bulk_create_children sends no post_save for the summary
+            DailySummary.add_loans(loans)
+            created += count
+            self.stdout.write("Created %d/%d loans" % (created, options['loans']))
+
+    def seed_customers(self, rng, count, batch_size, prefix, password):
+        locations = [location[:2] for location in LOCATIONS]
+        weights = [location[2] for location in LOCATIONS]
+
+        customer_ids = []
+        for start in range(0, count, batch_size):
+            numbers = range(start, min(start + batch_size, count))
+            User.objects.bulk_create([
+                User(
+                    username='%s%d' % (prefix, i), password=password,
+                    email='%s%d@example.com' % (prefix, i),
+                    first_name='Customer', last_name=str(i), is_customer=True,
+                )
+                for i in numbers
+            ])
+            # Not every backend returns ids from bulk_create
+            user_ids = User.objects.filter(
+                username__in=['%s%d' % (prefix, i) for i in numbers]
+            ).values_list('id', flat=True)
+
+            profiles = []
+            for user_id in user_ids:
+                country, city = rng.choices(locations, weights)[0]
+                profiles.append(CustomerProfile(
+                    user_id=user_id, phone='9%09d' % rng.randrange(10 ** 9),
+                    street_address='%d Main Street' % rng.randrange(1, 999),
+                    zip_code='%05d' % rng.randrange(10 ** 5),
+                    city=city, country=country,
+                ))
+            bulk_create_children(CustomerProfile, profiles)
+            customer_ids += [profile.id for profile in profiles]
+        return customer_ids
+
+    def seed_staff(self, agents, admins, prefix, password):
+        # bulk_create skips User.save, which makes active agents staff
+        User.objects.bulk_create([
+            User(
+                username='%sagent%d' % (prefix, i), password=password,
+                first_name='Agent', last_name=str(i), is_agent=True,
+                is_staff=True,
+            )
+            for i in range(agents)
+        ] + [
+            User(
+                username='%sadmin%d' % (prefix, i), password=password,
+                first_name='Admin', last_name=str(i), is_staff=True,
+                is_superuser=True,
+            )
+            for i in range(admins)
+        ])
+        self.stdout.write(
+            "Created %d agents and %d admins, usernames start with %s"
+            % (agents, admins, prefix)
+        )
+
+    def make_loan(self, rng, customer_ids):
+        loan_type = rng.choices(
+            list(LOAN_TYPES), [spec[0] for spec in LOAN_TYPES.values()]
+        )[0]
+        weight, median, tenures = LOAN_TYPES[loan_type]
+        status = rng.choices(
+            [s[0] for s in STATUSES], [s[1] for s in STATUSES]
+        )[0]
+
+        loan = Loan(
+            customer_id=rng.choice(customer_ids), loan_type=loan_type,
+            amount=Decimal(rng.lognormvariate(0, 0.5) * median).quantize(
+                Decimal('0.01')
+            ),
+            tenure=rng.choice(tenures),
+            interest_rate=settings.INTEREST_RATE[loan_type], status=status,
+        )
+        if status == 'approved':
+            # Same fields Loan.save() sets on approval, backdated up to 3 years
+            loan.set_approval(
+                timezone.now() - timedelta(days=rng.randrange(3 * 365))
+            )
+            elapsed = relativedelta(timezone.now(), loan.start_date)
+            loan.no_of_emi_left = max(
+                loan.tenure - elapsed.years * 12 - elapsed.months, 0
+            )
+        return loan
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.db import connections
+from django.utils.deprecation import MiddlewareMixin
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class QueryCountMiddleware(MiddlewareMixin):
+    """
+    With QUERY_COUNT_HEADER on, answers the number of database queries a
+    request made, on every database, in an X-Query-Count header, for load
+    tests against a running server (see benchmarks/load_test.py).
+
+    A MiddlewareMixin, so under ASGI the chain stays async. Its hooks run in
+    the thread of the request, which also runs the view's queries.
+
+    Streaming responses, such as exports, query while their body is sent,
+    after the header, so only the queries made before are counted.
+    """
+    def process_request(self, request):
+        if not settings.QUERY_COUNT_HEADER:
+            return
+        request.query_counter = QueryCounter()
+        for connection in connections.all():
+            connection.execute_wrappers.append(request.query_counter)
+
+    def process_response(self, request, response):
+        counter = getattr(request, 'query_counter', None)
+        if counter is None:
+            return response
+        for connection in connections.all():
+            if counter in connection.execute_wrappers:
+                connection.execute_wrappers.remove(counter)
+        response['X-Query-Count'] = counter.count
+        return response
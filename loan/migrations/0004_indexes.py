@@ -0,0 +1,49 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loan', 'adminmigrate'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='basemodel',
+            index=models.Index(fields=['created', 'id'], name='basemodel_created_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='basemodel',
+            index=models.Index(fields=['-modified'], name='basemodel_modified_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customerprofile',
+            index=models.Index(fields=['country', 'city'], name='customer_country_city_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='customerprofile',
+            index=models.Index(fields=['city'], name='customer_city_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['customer', 'status'], name='loan_customer_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(condition=models.Q(('status', 'new')), fields=['basemodel_ptr'], name='loan_new_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['start_date'], name='loan_start_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['end_date'], name='loan_end_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='loan',
+            index=models.Index(fields=['tenure', 'status'], name='loan_tenure_status_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:28
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loan', '0004_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Installment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.IntegerField()),
+                ('due_date', models.DateField()),
+                ('amount', models.DecimalField(decimal_places=10, max_digits=20)),
+                ('principal', models.DecimalField(decimal_places=10, max_digits=20)),
+                ('interest', models.DecimalField(decimal_places=10, max_digits=20)),
+                ('balance', models.DecimalField(decimal_places=10, max_digits=20)),
+                ('loan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='installments', to='loan.loan')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='installment',
+            index=models.Index(fields=['due_date'], name='installment_due_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='installment',
+            constraint=models.UniqueConstraint(fields=('loan', 'number'), name='installment_loan_number_uniq'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:29
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loan', '0005_installment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Payment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=10, max_digits=20)),
+                ('paid_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('reference', models.CharField(blank=True, max_length=64)),
+                ('loan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payments', to='loan.loan')),
+                ('recorded_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['loan', 'paid_at'], name='payment_loan_paid_at_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loan', '0006_payment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LoanHistory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('changed_at', models.DateTimeField()),
+                ('changes', models.JSONField()),
+                ('loan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='history', to='loan.loan')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='loanhistory',
+            index=models.Index(fields=['loan', 'changed_at'], name='loanhistory_loan_changed_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:34
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loan', '0007_loanhistory'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loan',
+            name='created_by',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='filed_loans', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
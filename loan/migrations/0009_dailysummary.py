@@ -0,0 +1,31 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loan', '0008_loan_created_by'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('loan_type', models.CharField(choices=[('home', 'Home Loan'), ('car', 'Car loan'), ('personal', 'personal')], max_length=50)),
+                ('status', models.CharField(choices=[('new', 'New'), ('rejected', 'Rejeted'), ('approved', 'Approved')], max_length=50)),
+                ('loans', models.IntegerField(default=0)),
+                ('amount', models.DecimalField(decimal_places=10, default=0, max_digits=30)),
+                ('principal_amount', models.DecimalField(decimal_places=10, default=0, max_digits=30)),
+                ('emi', models.DecimalField(decimal_places=10, default=0, max_digits=30)),
+                ('amount_paid', models.DecimalField(decimal_places=10, default=0, max_digits=30)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='dailysummary',
+            constraint=models.UniqueConstraint(fields=('day', 'loan_type', 'status'), name='dailysummary_key_uniq'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 3.2.25 on 2026-10-18 19:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loan', '0009_dailysummary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job', models.CharField(max_length=255)),
+                ('source', models.CharField(max_length=50)),
+                ('position', models.IntegerField(default=0)),
+                ('modified', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='importcheckpoint',
+            constraint=models.UniqueConstraint(fields=('job', 'source'), name='importcheckpoint_job_source_uniq'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.2.25 on 2026-10-18 20:29
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def set_financed_amount(apps, schema_editor):
+    """
+    Amount financed of the approved loans: the split of their installments,
+    or for loans without one, principal_amount before the payments posted
+    """
+    Loan = apps.get_model('loan', 'Loan')
+    Installment = apps.get_model('loan', 'Installment')
+    Payment = apps.get_model('loan', 'Payment')
+    decimal = models.DecimalField(max_digits=20, decimal_places=10)
+    scheduled = Installment.objects.filter(loan=OuterRef('pk')).order_by('number')
+    paid = Payment.objects.filter(loan=OuterRef('pk')).order_by().values('loan').annotate(
+        total=Sum('amount')
+    )
+    Loan.objects.filter(status='approved').update(financed_amount=Coalesce(
+        Subquery(scheduled.values('principal')[:1]) * F('tenure'),
+        F('amount') - Coalesce(F('amount_paid'), Value(Decimal(0)))
+        + Coalesce(Subquery(paid.values('total')), Value(Decimal(0))),
+        output_field=decimal,
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('loan', '0010_importcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loan',
+            name='financed_amount',
+            field=models.DecimalField(blank=True, decimal_places=10, max_digits=20, null=True),
+        ),
+        migrations.RunPython(set_financed_amount, migrations.RunPython.noop),
+    ]
@@ -1,12 +1,27 @@
-from django.db import models
-from django.contrib.auth.models import AbstractUser
+import datetime
+from decimal import Decimal
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, models, transaction
+from django.db.models import (
+    Count, F, Max, OuterRef, Q, Subquery, Sum, Value,
+)
+from django.db.models.functions import Coalesce, TruncDate
+from django.contrib.auth.models import AbstractUser, Group
 from django.utils import timezone
 from django_countries.fields import CountryField
 from dateutil.relativedelta import relativedelta
 from model_utils import FieldTracker 
 
+from .caching import invalidate
+
 TYPE =   [('home', 'Home Loan'),('car', 'Car loan'),('personal', 'personal')]
 STATUS = [('new','New'),('rejected','Rejeted'),('approved', 'Approved')]
+ADMIN_GROUP = "Admin"
+AGENT_GROUP = "Agent"
 
 # Create your models here.
 
@@ -25,7 +40,58 @@ class User(AbstractUser):
     
     #To check if user is admin
     def is_admin(self):
-        return self.is_superuser | bool(self.groups.filter(name__in=["Admin"]))
+        return self.is_superuser or self.in_admin_group()
+
+    # Group membership is looked up once per user object (i.e. per request).
+    # With a cache every process shares (SHARED_CACHE) it is also kept
+    # between requests, invalidated from loan.signals when the user's groups
+    # change. A per process cache would only be invalidated in the process
+    # that made the change, and a user removed from the group would stay
+    # admin on the other workers.
+    def in_admin_group(self):
+        if self.pk is None:
+            return False
+        if not hasattr(self, '_in_admin_group'):
+            if not settings.SHARED_CACHE:
+                self._in_admin_group = self.groups.filter(name=ADMIN_GROUP).exists()
+                return self._in_admin_group
+            key = admin_group_cache_key(self.pk)
+            in_group = cache.get(key)
+            if in_group is None:
+                in_group = self.groups.filter(name=ADMIN_GROUP).exists()
+                cache.set(key, in_group, settings.ROLE_CACHE_TIMEOUT)
+            self._in_admin_group = in_group
+        return self._in_admin_group
+
+    #Role of the user, admin taking precedence over agent and customer
+    @property
+    def role(self):
+        if self.is_admin():
+            return "admin"
+        if self.is_agent:
+            return "agent"
+        if self.is_customer:
+            return "customer"
+        return None
+
+
+def admin_group_cache_key(user_id):
+    return "loan:user:%s:in-admin-group" % user_id
+
+
+def group_cache_key(name):
+    # Group names may contain spaces, which memcached keys can not
+    return "loan:group:%s:id" % quote(name)
+
+
+# Group ids are cached so signups can add users to a group without a query
+def group_id(name):
+    key = group_cache_key(name)
+    pk = cache.get(key)
+    if pk is None:
+        pk = Group.objects.get(name=name).pk
+        cache.set(key, pk, settings.ROLE_CACHE_TIMEOUT)
+    return pk
 
 
 #Base
@@ -33,6 +99,14 @@ class BaseModel(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     modified = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination seeks on (created, id)
+            models.Index(fields=['created', 'id'], name='basemodel_created_id_idx'),
+            # Admin changelists order by -modified
+            models.Index(fields=['-modified'], name='basemodel_modified_idx'),
+        ]
+
 
 #Customer profiles
 class CustomerProfile(BaseModel):
@@ -43,12 +117,160 @@ class CustomerProfile(BaseModel):
     city = models.CharField(max_length=1024)
     country = CountryField()
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['country', 'city'], name='customer_country_city_idx'),
+            models.Index(fields=['city'], name='customer_city_idx'),
+        ]
+
     def __str__(self):
         return "%s %s - %s, %s" % (
             self.user.first_name, self.user.last_name, self.city, self.country
         )
 
 
+#Loan queryset
+class LoanQuerySet(models.QuerySet):
+    # Rows locked and updated per statement
+    batch_size = 1000
+
+    def approve(self):
+        """
+        Bulk version of the approval in Loan.save: the approval fields are
+        computed by Loan.set_approval, as on a single save, and written with
+        one UPDATE per batch, with one start_date / modified timestamp for
+        the batch.
+
+        Loans that are already approved (or that already have dates) are
+        skipped. Returns (approved ids, skipped ids).
+        """
+        now = timezone.now()
+        with transaction.atomic(using=self.db):
+            rows = list(
+                self.select_for_update().order_by().values(
+                    'id', 'tenure', 'created', 'loan_type', 'amount',
+                    'amount_paid', 'interest_rate', *APPROVAL_FIELDS
+                )
+            )
+            skipped = []
+            loans = {}
+            history = []
+            for row in rows:
+                if row['status'] == 'approved' or row['start_date'] or row['end_date']:
+                    skipped.append(row['id'])
+                    continue
+                history.append(LoanHistory.delta(
+                    row['id'], now, {field: row[field] for field in APPROVAL_FIELDS}
+                ))
+                loan = Loan(
+                    pk=row['id'], amount=row['amount'], amount_paid=row['amount_paid'],
+                    tenure=row['tenure'], interest_rate=row['interest_rate'],
+                    modified=now,
+                )
+                loan.set_approval(now)
+                loans[loan.pk] = loan
+
+            Loan.objects.using(self.db).bulk_update(
+                loans.values(), [*APPROVAL_FIELDS, 'modified'],
+                batch_size=self.batch_size,
+            )
+            approved = list(loans)
+            LoanHistory.objects.using(self.db).bulk_create(
+                history, batch_size=self.batch_size
+            )
+            DailySummary.move_many([
+                (
+                    DailySummary.values_of_row(row),
+                    DailySummary.values_of_row(
+                        row, status='approved',
+                        principal_amount=loans[row['id']].principal_amount,
+                        emi=loans[row['id']].emi,
+                    ),
+                )
+                for row in rows if row['id'] in loans
+            ], using=self.db)
+            # bulk_update sends no post_save
+            invalidate(Loan, using=self.db)
+            Loan.objects.using(self.db).filter(id__in=approved).extend_schedules(
+                schedule_horizon(now)
+            )
+        return approved, skipped
+
+    def reject(self):
+        """
+        Rejects the new loans in the queryset with one UPDATE per batch.
+        Approved and already rejected loans are skipped.
+        Returns (rejected ids, skipped ids).
+        """
+        now = timezone.now()
+        with transaction.atomic(using=self.db):
+            rows = list(
+                self.select_for_update().order_by().values(
+                    'id', 'status', 'created', 'loan_type',
+                    *DailySummary.SUMMED_FIELDS
+                )
+            )
+            rejected = [row['id'] for row in rows if row['status'] == 'new']
+            skipped = [row['id'] for row in rows if row['status'] != 'new']
+            for start in range(0, len(rejected), self.batch_size):
+                Loan.objects.using(self.db).filter(
+                    id__in=rejected[start:start + self.batch_size]
+                ).update(status='rejected', modified=now)
+            LoanHistory.objects.using(self.db).bulk_create(
+                [LoanHistory.delta(pk, now, {'status': 'new'}) for pk in rejected],
+                batch_size=self.batch_size,
+            )
+            DailySummary.move_many([
+                (
+                    DailySummary.values_of_row(row),
+                    DailySummary.values_of_row(row, status='rejected'),
+                )
+                for row in rows if row['status'] == 'new'
+            ], using=self.db)
+            invalidate(Loan, using=self.db)
+        return rejected, skipped
+
+    def extend_schedules(self, until, batch_size=1000):
+        """
+        Creates the installments of the approved loans in the queryset that
+        fall due on or before until and do not exist yet.
+        Returns the number of installments created.
+        """
+        last = Installment.objects.filter(loan=OuterRef('pk')).order_by('-number')
+        loans = self.filter(
+            status='approved', start_date__isnull=False
+        ).annotate(
+            scheduled=Coalesce(Max('installments__number'), 0),
+            scheduled_balance=Subquery(last.values('balance')[:1]),
+        ).filter(scheduled__lt=F('tenure'))
+
+        created = 0
+        pending = []
+        for loan in loans.iterator(chunk_size=batch_size):
+            pending += loan.make_installments(
+                loan.scheduled + 1, until, balance=loan.scheduled_balance
+            )
+            if len(pending) >= batch_size:
+                created += len(Installment.objects.using(self.db).bulk_create(pending))
+                pending = []
+        created += len(Installment.objects.using(self.db).bulk_create(pending))
+        return created
+
+
+# Fields the approval sets, their previous values go to the history
+APPROVAL_FIELDS = (
+    'status', 'start_date', 'end_date', 'principal_amount', 'financed_amount',
+    'no_of_emi_left', 'emi',
+)
+
+
+# Installments are generated SCHEDULE_MONTHS_AHEAD months ahead on approval,
+# and topped up by the extend_schedules command
+def schedule_horizon(now=None):
+    now = now or timezone.now()
+    return (now + relativedelta(months=settings.SCHEDULE_MONTHS_AHEAD)).date()
+
+
 #Loan model
 class Loan(BaseModel):
     customer = models.ForeignKey(CustomerProfile, on_delete=models.CASCADE)
@@ -60,34 +282,446 @@ class Loan(BaseModel):
     start_date = models.DateTimeField(null=True, blank=True)
     end_date = models.DateTimeField(null=True, blank=True)
     principal_amount = models.DecimalField(max_digits=20, decimal_places=10, null=True, blank=True)
+    # principal_amount at approval, payments lower principal_amount but the
+    # installments keep the split of the amount financed
+    financed_amount = models.DecimalField(max_digits=20, decimal_places=10, null=True, blank=True)
     status = models.CharField(max_length=50, choices= STATUS,default ='new')
     amount_paid = models.DecimalField(
         max_digits=20, decimal_places=10, null=True, blank=True
     )
     no_of_emi_left = models.IntegerField(null=True, blank=True)
+    # Agent or customer who filed the request
+    created_by = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True,
+        related_name='filed_loans'
+    )
 
     tracker = FieldTracker()
 
+    objects = LoanQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # A customer's loans, optionally narrowed to one status
+            models.Index(fields=['customer', 'status'], name='loan_customer_status_idx'),
+            # Approval queue, ids follow creation order
+            models.Index(
+                fields=['basemodel_ptr'], name='loan_new_queue_idx',
+                condition=models.Q(status='new'),
+            ),
+            models.Index(fields=['start_date'], name='loan_start_date_idx'),
+            models.Index(fields=['end_date'], name='loan_end_date_idx'),
+            models.Index(fields=['tenure', 'status'], name='loan_tenure_status_idx'),
+        ]
+
     def __str__(self):
         return "Loan Request for %s" % self.customer.user.first_name
 
 
     # After the loan request is approved, start_date and end_date is set,emi is calculated
+    # and the first months of the repayment schedule are generated
     def save(self, *args, **kwargs):
-        if self.status == "approved" and not self.start_date and not self.end_date:
-            self.start_date = timezone.now()
-            self.end_date = timezone.now() + relativedelta(months=self.tenure)
-            self.principal_amount = self.amount
-            self.no_of_emi_left = self.tenure
-        if self.amount_paid:
+        approved_now = (
+            self.status == "approved" and not self.start_date and not self.end_date
+        )
+        if approved_now:
+            self.set_approval(timezone.now())
+        # Direct edits of amount_paid only, payments are posted through
+        # post_payment and must not be recomputed on later saves
+        elif self.amount_paid and self.tracker.has_changed("amount_paid"):
             self.no_of_emi_left = self.tenure - 1
             self.principal_amount = self.amount - self.amount_paid
         if self.status == "approved" and self.tracker.has_changed("principal_amount"):
             self.emi = self.calculate_emi()
-        return super(Loan, self).save(*args, **kwargs)
+        previous = {} if self._state.adding else self.tracker.changed()
+        # The edit is never saved without its history row
+        with transaction.atomic():
+            saved = super(Loan, self).save(*args, **kwargs)
+            if previous:
+                self.push_history(previous)
+            if approved_now:
+                self.extend_schedule(schedule_horizon(self.start_date))
+        return saved
+
+    # The APPROVAL_FIELDS of a loan approved at now, what was already paid
+    # is taken off the principal. Loan.save and LoanQuerySet.approve both
+    # approve through it.
+    def set_approval(self, now):
+        self.status = "approved"
+        self.start_date = now
+        self.end_date = now + relativedelta(months=self.tenure)
+        self.principal_amount = self.amount - (self.amount_paid or 0)
+        self.financed_amount = self.principal_amount
+        self.no_of_emi_left = self.tenure - 1 if self.amount_paid else self.tenure
+        self.emi = self.calculate_emi()
+
+    # Previous values of the fields changed by an edit go to the history
+    def push_history(self, previous, changed_at=None):
+        history = LoanHistory.delta(self.pk, changed_at or self.modified, previous)
+        if history.changes:
+            history.save()
+        return history
+
+    def as_of(self, when):
+        """
+        Unsaved copy of the loan as it was at when, rebuilt from the current
+        row by undoing the edits made after it, newest first. None if the
+        loan did not exist yet.
+        """
+        if when < self.created:
+            return None
+        state = Loan(**{
+            field.attname: getattr(self, field.attname)
+            for field in self._meta.concrete_fields
+        })
+        edits = self.history.filter(changed_at__gt=when).order_by('-changed_at', '-id')
+        for changes in edits.values_list('changes', flat=True):
+            for attname, value in changes.items():
+                setattr(state, attname, self._meta.get_field(attname).to_python(value))
+        state.modified = self.history.filter(changed_at__lte=when).aggregate(
+            modified=Max('changed_at')
+        )['modified'] or self.created
+        return state
+
+    def extend_schedule(self, until):
+        return Loan.objects.filter(pk=self.pk).extend_schedules(until)
+
+    def post_payment(self, amount, **fields):
+        """
+        Appends a payment to the ledger and updates the running totals of
+        the loan: amount_paid grows by the payment, principal_amount is
+        amount - amount_paid and no_of_emi_left drops by every emi fully
+        covered. The loan row stays locked until the transaction commits,
+        so concurrent payments of one loan are applied one after the other.
+        """
+        amount = Decimal(amount)
+        if amount <= 0:
+            raise ValidationError("Payment amount must be positive.")
+
+        with transaction.atomic():
+            loan = Loan.objects.select_for_update().get(pk=self.pk)
+            if loan.status != "approved":
+                raise ValidationError("Only approved loans can be repaid.")
+            amount_paid = (loan.amount_paid or 0) + amount
+            if amount_paid > loan.emi * loan.tenure:
+                raise ValidationError("Payment exceeds the outstanding balance.")
+
+            payment = Payment.objects.create(loan=loan, amount=amount, **fields)
+            totals = {
+                "amount_paid": amount_paid,
+                "principal_amount": max(loan.amount - amount_paid, 0),
+                "no_of_emi_left": max(
+                    loan.tenure - int(amount_paid // loan.emi), 0
+                ),
+            }
+            Loan.objects.filter(pk=loan.pk).update(
+                modified=payment.paid_at, **totals
+            )
+            loan.push_history(
+                {field: getattr(loan, field) for field in totals},
+                changed_at=payment.paid_at,
+            )
+            DailySummary.move(
+                DailySummary.values_of(loan),
+                dict(DailySummary.values_of(loan), **totals),
+            )
+            invalidate(Loan)
+
+        for field, value in totals.items():
+            setattr(self, field, value)
+        self.tracker.set_saved_fields(fields=list(totals))
+        return payment
+
+    # Flat interest split of the amount financed, installments first..tenure
+    # due on or before until. balance is the balance of installment first - 1,
+    # if it exists.
+    def make_installments(self, first, until, balance=None):
+        financed = Decimal(
+            self.financed_amount if self.financed_amount is not None
+            else self.principal_amount
+        )
+        principal = financed / self.tenure
+        interest = financed * Decimal(self.interest_rate) / (12 * 100)
+        if balance is None:
+            balance = financed - principal * (first - 1)
+        installments = []
+        for number in range(first, self.tenure + 1):
+            due_date = (self.start_date + relativedelta(months=number)).date()
+            if due_date > until:
+                break
+            balance = balance - principal if number < self.tenure else Decimal(0)
+            installments.append(Installment(
+                loan_id=self.pk, number=number, due_date=due_date,
+                amount=principal + interest, principal=principal,
+                interest=interest, balance=balance,
+            ))
+        return installments
     
     #To calculate emi based on principal amount and interest rate
     def calculate_emi(self):
         i = (self.principal_amount)*(self.interest_rate)*(self.tenure)/(12*100)
         emi = (self.principal_amount + i)/self.tenure
-        return emi
\ No newline at end of file
+        return emi
+
+
+#Edits of a loan, each row only keeps the previous values of the fields
+#that changed
+class LoanHistory(models.Model):
+    # Bookkeeping fields, never part of a delta
+    IGNORED_FIELDS = {'id', 'basemodel_ptr_id', 'created', 'modified'}
+
+    loan = models.ForeignKey(Loan, on_delete=models.CASCADE, related_name='history')
+    changed_at = models.DateTimeField()
+    changes = models.JSONField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['loan', 'changed_at'], name='loanhistory_loan_changed_idx'),
+        ]
+
+    @classmethod
+    def delta(cls, loan_id, changed_at, previous):
+        """
+        Unsaved history row from {attname: previous value}. Values are
+        stored as JSON strings/numbers, Loan field to_python() reads them
+        back.
+        """
+        changes = {}
+        for attname, value in previous.items():
+            if attname in cls.IGNORED_FIELDS:
+                continue
+            if isinstance(value, Decimal):
+                value = str(value)
+            elif isinstance(value, datetime.date):
+                value = value.isoformat()
+            changes[attname] = value
+        return cls(loan_id=loan_id, changed_at=changed_at, changes=changes)
+
+    def __str__(self):
+        return "Edit of loan %d at %s" % (self.loan_id, self.changed_at)
+
+
+def summary_day(created):
+    return timezone.localdate(created)
+
+
+def summary_day_range(day):
+    # [start, end) of a summary day, compared with created as it is stored
+    # so the database can use an index
+    start = timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+    return start, timezone.make_aware(
+        datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time.min)
+    )
+
+
+#Loans per day of creation, loan type and status, kept up to date with the
+#loans so dashboards read a few rows instead of aggregating every loan
+class DailySummary(models.Model):
+    # Loan fields summed per row
+    SUMMED_FIELDS = ('amount', 'principal_amount', 'emi', 'amount_paid')
+
+    day = models.DateField()
+    loan_type = models.CharField(max_length=50, choices=TYPE)
+    status = models.CharField(max_length=50, choices=STATUS)
+    loans = models.IntegerField(default=0)
+    amount = models.DecimalField(max_digits=30, decimal_places=10, default=0)
+    principal_amount = models.DecimalField(max_digits=30, decimal_places=10, default=0)
+    emi = models.DecimalField(max_digits=30, decimal_places=10, default=0)
+    amount_paid = models.DecimalField(max_digits=30, decimal_places=10, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['day', 'loan_type', 'status'], name='dailysummary_key_uniq'
+            ),
+        ]
+
+    @classmethod
+    def values_of(cls, loan, saved=False):
+        """
+        Fields of a loan the summary depends on, the saved ones (as the
+        FieldTracker last saw them) or the current ones
+        """
+        get = loan.tracker.previous if saved else lambda field: getattr(loan, field)
+        values = {field: get(field) for field in ('loan_type', 'status') + cls.SUMMED_FIELDS}
+        values['day'] = summary_day(loan.created)
+        return values
+
+    @classmethod
+    def values_of_row(cls, row, **changes):
+        """
+        values_of for a row of Loan.objects.values() with created and the
+        summary fields, with changes applied
+        """
+        values = {field: row[field] for field in ('loan_type', 'status') + cls.SUMMED_FIELDS}
+        values['day'] = summary_day(row['created'])
+        values.update(changes)
+        return values
+
+    @classmethod
+    def move(cls, old=None, new=None, using=None):
+        """
+        Takes a loan's contribution out of the row of old values and adds
+        it to the row of new ones (either can be None, for a created or a
+        deleted loan)
+        """
+        cls.move_many([(old, new)], using=using)
+
+    @classmethod
+    def move_many(cls, changes, using=None):
+        """
+        move for many (old, new) pairs, one update per summary row
+        """
+        deltas = {}
+        for old, new in changes:
+            for values, sign in ((old, -1), (new, 1)):
+                if values is not None:
+                    cls.collect(deltas, values, sign)
+        cls.apply(deltas, using=using)
+
+    @classmethod
+    def add_loans(cls, loans, using=None):
+        """
+        Adds loans inserted without Loan.save, one update per summary row
+        """
+        deltas = {}
+        for loan in loans:
+            cls.collect(deltas, cls.values_of(loan), 1)
+        cls.apply(deltas, using=using)
+
+    @classmethod
+    def collect(cls, deltas, values, sign):
+        key = (values['day'], values['loan_type'], values['status'])
+        delta = deltas.setdefault(key, dict.fromkeys(('loans',) + cls.SUMMED_FIELDS, 0))
+        delta['loans'] += sign
+        for field in cls.SUMMED_FIELDS:
+            delta[field] += sign * Decimal(values[field] or 0)
+
+    @classmethod
+    def apply(cls, deltas, using=None):
+        for (day, loan_type, status), delta in deltas.items():
+            if not any(delta.values()):
+                continue
+            rows = cls.objects.using(using).filter(
+                day=day, loan_type=loan_type, status=status
+            )
+            increments = {field: F(field) + value for field, value in delta.items()}
+            if rows.update(**increments):
+                continue
+            try:
+                with transaction.atomic(using=using):
+                    cls.objects.using(using).create(
+                        day=day, loan_type=loan_type, status=status, **delta
+                    )
+            except IntegrityError:
+                # Created by a concurrent transaction in the meantime
+                rows.update(**increments)
+
+    @classmethod
+    def rebuild(cls, days=None, using=None):
+        """
+        Recomputes the rows of the given days (every day if None) from the
+        loans. Writes keep the summary up to date incrementally, this is for
+        manage.py rebuild_daily_summary, to load data or repair drift.
+        """
+        loans = Loan.objects.using(using).order_by()
+        summaries = cls.objects.using(using)
+        if days is not None:
+            if not days:
+                return 0
+            ranges = Q()
+            for day in days:
+                start, end = summary_day_range(day)
+                ranges |= Q(created__gte=start, created__lt=end)
+            loans = loans.filter(ranges)
+            summaries = summaries.filter(day__in=days)
+
+        rows = loans.values(
+            summary_day=TruncDate('created'), summary_type=F('loan_type'),
+            summary_status=F('status'),
+        ).annotate(
+            summary_loans=Count('id'),
+            **{
+                'summary_%s' % field: Coalesce(Sum(field), Value(Decimal(0)))
+                for field in cls.SUMMED_FIELDS
+            }
+        )
+        with transaction.atomic(using=using):
+            summaries.delete()
+            created = cls.objects.using(using).bulk_create([
+                cls(
+                    day=row['summary_day'], loan_type=row['summary_type'],
+                    status=row['summary_status'], loans=row['summary_loans'],
+                    **{field: row['summary_%s' % field] for field in cls.SUMMED_FIELDS}
+                )
+                for row in rows.iterator()
+            ], batch_size=1000)
+        return len(created)
+
+    def __str__(self):
+        return "%s %s %s loans on %s" % (self.loans, self.status, self.loan_type, self.day)
+
+
+#Progress of an import_book run, saved in the transaction of every chunk
+#so an interrupted import resumes after the last committed row
+class ImportCheckpoint(models.Model):
+    job = models.CharField(max_length=255)
+    source = models.CharField(max_length=50)
+    position = models.IntegerField(default=0)
+    modified = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['job', 'source'], name='importcheckpoint_job_source_uniq'),
+        ]
+
+    def __str__(self):
+        return "%s %s at row %d" % (self.job, self.source, self.position)
+
+
+#Payment ledger, rows are only ever appended
+class Payment(models.Model):
+    loan = models.ForeignKey(Loan, on_delete=models.CASCADE, related_name='payments')
+    amount = models.DecimalField(max_digits=20, decimal_places=10)
+    paid_at = models.DateTimeField(default=timezone.now)
+    reference = models.CharField(max_length=64, blank=True)
+    recorded_by = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['loan', 'paid_at'], name='payment_loan_paid_at_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValidationError("Payments can not be changed once posted.")
+        return super(Payment, self).save(*args, **kwargs)
+
+    def __str__(self):
+        return "Payment of %s for loan %d" % (self.amount, self.loan_id)
+
+
+#Repayment schedule of an approved loan. Not a BaseModel, a loan has one row
+#per month so the table stays narrow and free of the parent table join
+class Installment(models.Model):
+    loan = models.ForeignKey(Loan, on_delete=models.CASCADE, related_name='installments')
+    number = models.IntegerField()
+    due_date = models.DateField()
+    amount = models.DecimalField(max_digits=20, decimal_places=10)
+    principal = models.DecimalField(max_digits=20, decimal_places=10)
+    interest = models.DecimalField(max_digits=20, decimal_places=10)
+    balance = models.DecimalField(max_digits=20, decimal_places=10)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['loan', 'number'], name='installment_loan_number_uniq'),
+        ]
+        indexes = [
+            # Collections: everything due on a day
+            models.Index(fields=['due_date'], name='installment_due_date_idx'),
+        ]
+
+    def __str__(self):
+        return "Installment %d of loan %d" % (self.number, self.loan_id)
@@ -0,0 +1,133 @@
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+
+#Keyset (seek) pagination
+class KeysetPagination(BasePagination):
+    """
+    Paginates on an ascending, unique ordering such as (created, id).
+
+    The cursor carries the ordering values of the last row that was sent,
+    and the next page is fetched with ``WHERE (created, id) > (...)`` instead
+    of an OFFSET, so a deep page costs the same as the first one.
+    """
+    ordering = ('created', 'id')
+    page_size = api_settings.PAGE_SIZE
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.model = queryset.model
+
+        position, self.reverse = self.decode_cursor(request)
+        if self.reverse:
+            queryset = queryset.order_by(*['-%s' % f for f in self.ordering])
+        else:
+            queryset = queryset.order_by(*self.ordering)
+        if position is not None:
+            queryset = queryset.filter(self.get_keyset_filter(position))
+
+        # Fetch one extra row to find out if there is anything beyond this page
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+
+        if self.reverse:
+            self.page.reverse()
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+        return self.page
+
+    def get_keyset_filter(self, position):
+        """
+        Builds the row comparison (a, b) > (x, y) as
+        a > x OR (a = x AND b > y), which the database can answer with an
+        index range scan
+        """
+        lookup = 'lt' if self.reverse else 'gt'
+        condition = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            condition |= Q(**equal, **{'%s__%s' % (field, lookup): value})
+            equal[field] = value
+        return condition
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_position(self, obj):
+        return [getattr(obj, field) for field in self.ordering]
+
+    def encode_cursor(self, position, reverse):
+        # str() keeps microseconds, which DjangoJSONEncoder would truncate
+        payload = json.dumps({'p': position, 'r': int(reverse)}, default=str)
+        cursor = base64.urlsafe_b64encode(payload.encode('utf-8'))
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, cursor.decode('ascii')
+        )
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None, False
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode('ascii')))
+            values = payload['p']
+            if len(values) != len(self.ordering):
+                raise ValueError(encoded)
+            position = [
+                self.model._meta.get_field(field).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+            return position, bool(payload.get('r'))
+        except (
+            binascii.Error, KeyError, TypeError, ValueError, ValidationError,
+        ):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.get_position(self.page[-1]), False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.get_position(self.page[0]), True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_html_context(self):
+        return {
+            'previous_url': self.get_previous_link(),
+            'next_url': self.get_next_link(),
+        }
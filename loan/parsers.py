@@ -0,0 +1,30 @@
+import json
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+
+class NDJSONParser(BaseParser):
+    """
+    Parses newline delimited JSON, one object per line, into a list
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        rows = []
+        if stream is None:
+            return rows
+        for number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rows.append(json.loads(line.decode(encoding)))
+            except ValueError as exc:
+                raise ParseError(
+                    'NDJSON parse error on line %d - %s' % (number, exc)
+                )
+        return rows
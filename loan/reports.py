@@ -0,0 +1,152 @@
+"""
+Portfolio reports, grouped and aggregated by the database.
+
+Every report takes a Loan queryset (already filtered by PortfolioFilter)
+and returns one values() dict per group, so only the aggregates leave the
+database. Counts per status use conditional aggregation, one pass over the
+loans fills every column.
+
+Percentiles need PERCENTILE_CONT and are only reported on PostgreSQL.
+"""
+import datetime
+
+from django.db import connections
+from django.db.models import (
+    Aggregate, Avg, Count, DecimalField, F, FloatField, Q, Sum,
+)
+from django.db.models.functions import Cast, Coalesce, NullIf, TruncMonth
+from django.utils import timezone
+
+APPROVED = Q(status='approved')
+REJECTED = Q(status='rejected')
+NEW = Q(status='new')
+
+PERCENTILES = (0.5, 0.9)
+
+
+class Percentile(Aggregate):
+    """
+    Continuous percentile of an expression, PostgreSQL only
+    """
+    function = 'PERCENTILE_CONT'
+    name = 'Percentile'
+    template = '%(function)s(%(fraction)s) WITHIN GROUP (ORDER BY %(expressions)s)'
+    output_field = FloatField()
+
+    def __init__(self, expression, fraction, **extra):
+        if not 0 <= fraction <= 1:
+            raise ValueError("fraction must be between 0 and 1")
+        super().__init__(expression, fraction=float(fraction), **extra)
+
+
+def supports_percentiles(queryset):
+    return connections[queryset.db].vendor == 'postgresql'
+
+
+def status_counts():
+    return {
+        'loans': Count('id'),
+        'new': Count('id', filter=NEW),
+        'approved': Count('id', filter=APPROVED),
+        'rejected': Count('id', filter=REJECTED),
+    }
+
+
+def by_loan_type(loans):
+    """
+    Volume, outstanding principal and EMI totals per loan type
+    """
+    aggregates = dict(
+        status_counts(),
+        total_amount=Sum('amount'),
+        avg_amount=Avg('amount'),
+        avg_tenure=Avg('tenure'),
+        outstanding_principal=Sum('principal_amount', filter=APPROVED),
+        total_paid=Sum('amount_paid', filter=APPROVED),
+        monthly_emi=Sum('emi', filter=APPROVED & Q(no_of_emi_left__gt=0)),
+    )
+    if supports_percentiles(loans):
+        for fraction in PERCENTILES:
+            aggregates['amount_p%d' % (fraction * 100)] = Percentile(
+                'amount', fraction
+            )
+    return list(
+        loans.order_by('loan_type').values('loan_type').annotate(**aggregates)
+    )
+
+
+def by_agent(loans):
+    """
+    Loans filed by each agent and the share of the decided ones that were
+    approved
+    """
+    return list(
+        loans.filter(created_by__is_agent=True)
+        .order_by('created_by')
+        .values(agent=F('created_by'), username=F('created_by__username'))
+        .annotate(**status_counts())
+        .annotate(approval_rate=Cast('approved', FloatField()) / NullIf(
+            Cast(F('approved') + F('rejected'), FloatField()), 0.0
+        ))
+    )
+
+
+def emi_by_month(loans):
+    """
+    Installments falling due per month over the whole tenure of the approved
+    loans, whether their schedules were generated yet or not.
+
+    A loan pays the same flat split of its amount financed every month (see
+    Loan.make_installments), so the database sums the loans per start month
+    and tenure, and each group is spread over the months of its tenure.
+    """
+    groups = (
+        loans.filter(status='approved', start_date__isnull=False)
+        .annotate(
+            start=TruncMonth('start_date', tzinfo=timezone.utc),
+            financed=Coalesce('financed_amount', 'principal_amount'),
+        )
+        .order_by()
+        .values('start', 'tenure')
+        .annotate(
+            loans=Count('id'),
+            financed_sum=Sum('financed'),
+            financed_rate=Sum(
+                F('financed') * F('interest_rate'),
+                output_field=DecimalField(max_digits=40, decimal_places=20),
+            ),
+        )
+    )
+    # Running totals change in the month after a group's start month and in
+    # the month after its last installment
+    changes = {}
+    for group in groups:
+        first = month_index(group['start']) + 1
+        principal = group['financed_sum'] / group['tenure']
+        interest = group['financed_rate'] / (12 * 100)
+        for index, sign in ((first, 1), (first + group['tenure'], -1)):
+            change = changes.setdefault(index, [0, 0, 0])
+            change[0] += sign * group['loans']
+            change[1] += sign * principal
+            change[2] += sign * interest
+
+    months = []
+    installments, principal, interest = 0, 0, 0
+    for index in range(min(changes, default=0), max(changes, default=0)):
+        if index in changes:
+            installments += changes[index][0]
+            principal += changes[index][1]
+            interest += changes[index][2]
+        if installments:
+            months.append({
+                'month': datetime.date(index // 12, index % 12 + 1, 1),
+                'installments': installments,
+                'emi': principal + interest,
+                'principal': principal,
+                'interest': interest,
+            })
+    return months
+
+
+def month_index(day):
+    return day.year * 12 + day.month - 1
@@ -0,0 +1,125 @@
+"""
+Read replicas for safe requests.
+
+ReplicaRoutingMiddleware marks every request, and PrimaryReplicaRouter
+sends the reads of loan models made while serving a GET or HEAD request
+(lists, detail views, exports, reports, the admin changelists) to one of
+READ_REPLICAS, picked once per request.
+
+Everything else reads from the primary: unsafe requests, code running
+outside of a request, sessions and groups, the user lookup of the
+request, and every request of a user for REPLICA_STICKY_SECONDS after
+they sent a write, so an agent sees their own edit even when the
+replicas lag behind. That window is kept in a signed cookie rather than
+the cache, which is per process unless configured, so it holds whichever
+worker serves the next request.
+"""
+import contextvars
+import random
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import DEFAULT_DB_ALIAS
+from django.dispatch import receiver
+from django.utils.deprecation import MiddlewareMixin
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+STICKY_COOKIE = 'loan_primary_reads'
+STICKY_SALT = 'loan.routers.sticky'
+
+_reads = contextvars.ContextVar('loan_request_reads', default=None)
+
+
+def replicas():
+    return settings.READ_REPLICAS if settings.USE_READ_REPLICA else []
+
+
+class RequestReads:
+    """
+    Database the reads of one request go to, decided on its first read
+    """
+    def __init__(self, request):
+        self.request = request
+        self.alias = None
+        self.deciding = False
+
+    def db(self):
+        if self.alias is None:
+            if self.deciding:
+                # Reads made to decide, such as loading the user
+                return DEFAULT_DB_ALIAS
+            self.deciding = True
+            try:
+                self.alias = self.decide()
+            finally:
+                self.deciding = False
+        return self.alias
+
+    def decide(self):
+        choices = replicas()
+        if not choices or self.request.method not in SAFE_METHODS:
+            return DEFAULT_DB_ALIAS
+        if wrote_recently(self.request):
+            return DEFAULT_DB_ALIAS
+        return random.choice(choices)
+
+
+def wrote_recently(request):
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return False
+    writer = request.get_signed_cookie(
+        STICKY_COOKIE, default=None, salt=STICKY_SALT,
+        max_age=settings.REPLICA_STICKY_SECONDS,
+    )
+    return writer == str(user.pk)
+
+
+class ReplicaRoutingMiddleware(MiddlewareMixin):
+    def process_request(self, request):
+        _reads.set(RequestReads(request))
+
+    def process_response(self, request, response):
+        user = getattr(request, 'user', None)
+        if request.method not in SAFE_METHODS and user is not None and \
+                user.is_authenticated:
+            # The signature is timestamped, reads check its age
+            response.set_signed_cookie(
+                STICKY_COOKIE, str(user.pk), salt=STICKY_SALT,
+                max_age=settings.REPLICA_STICKY_SECONDS,
+                secure=settings.SESSION_COOKIE_SECURE, httponly=True,
+                samesite='Lax',
+            )
+        return response
+
+
+# Streaming responses read until they are closed, which sends
+# request_finished
+@receiver(request_finished)
+def forget_request_reads(sender, **kwargs):
+    _reads.set(None)
+
+
+class PrimaryReplicaRouter:
+    """
+    Reads of loan models go where the current request's RequestReads
+    says, all writes and migrations go to the primary
+    """
+    def db_for_read(self, model, **hints):
+        reads = _reads.get()
+        if reads is None or model._meta.app_label != 'loan':
+            return None
+        return reads.db()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.READ_REPLICAS}
+        if {obj1._state.db, obj2._state.db} <= databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == DEFAULT_DB_ALIAS
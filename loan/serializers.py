@@ -1,4 +1,6 @@
-from .models import CustomerProfile, Loan
+from decimal import Decimal
+
+from .models import CustomerProfile, Loan, LoanHistory, Payment, User
 from rest_framework import serializers
 
 
@@ -7,13 +9,95 @@ class CustomerSerializer(serializers.ModelSerializer):
         model = CustomerProfile
         fields = "__all__"
 
+# Set by Loan.save and the approval workflow, only shown to API clients
+# (forms skip read only fields)
+LOAN_STATE_FIELDS = (
+    "id", "status", "emi", "start_date", "end_date", "principal_amount",
+    "amount_paid", "no_of_emi_left", "created", "modified",
+)
+
 class CustomerLoanSerializer(serializers.ModelSerializer):
     class Meta:
         model = Loan
-        fields = ("loan_type", "amount", "tenure", "interest_rate", "customer")
-        read_only_fields =  ('customer','interest_rate')
+        fields = ("loan_type", "amount", "tenure", "interest_rate", "customer") + LOAN_STATE_FIELDS
+        read_only_fields =  ('customer','interest_rate') + LOAN_STATE_FIELDS
 
 class LoanSerializer(serializers.ModelSerializer):
     class Meta:
         model = Loan
-        fields = ("loan_type", "amount", "tenure", "interest_rate", "customer") 
\ No newline at end of file
+        fields = ("loan_type", "amount", "tenure", "interest_rate", "customer") + LOAN_STATE_FIELDS
+        read_only_fields = LOAN_STATE_FIELDS
+
+class BulkLoanSerializer(serializers.ModelSerializer):
+    """
+    One row of a bulk loan upload. customer is a plain id so the customers
+    of all rows can be checked with one query, and interest_rate is taken
+    from settings.INTEREST_RATE
+    """
+    customer = serializers.IntegerField()
+
+    class Meta:
+        model = Loan
+        fields = ("loan_type", "amount", "tenure", "customer")
+
+
+class LoanIdsSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(), allow_empty=False
+    )
+
+
+class PaymentSerializer(serializers.ModelSerializer):
+    amount = serializers.DecimalField(
+        max_digits=20, decimal_places=10, min_value=Decimal("0.01")
+    )
+
+    class Meta:
+        model = Payment
+        fields = ("id", "loan", "amount", "paid_at", "reference", "recorded_by")
+        read_only_fields = ("loan", "paid_at", "recorded_by")
+
+
+class LoanHistorySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = LoanHistory
+        fields = ("changed_at", "changes")
+
+
+class ImportCustomerSerializer(serializers.ModelSerializer):
+    """
+    One customer of an import_book file, the user and the profile in one
+    flat row. Users imported without a password get an unusable one.
+    """
+    # The same rules as signups
+    username = serializers.CharField(
+        max_length=150, validators=[User.username_validator]
+    )
+    email = serializers.EmailField(required=False, allow_blank=True, default="")
+    first_name = serializers.CharField(max_length=150)
+    last_name = serializers.CharField(max_length=150)
+    password = serializers.CharField(required=False, allow_blank=True, default="")
+
+    class Meta:
+        model = CustomerProfile
+        fields = (
+            "username", "email", "first_name", "last_name", "password",
+            "phone", "street_address", "zip_code", "city", "country",
+        )
+
+
+class ImportLoanSerializer(serializers.ModelSerializer):
+    """
+    One loan of an import_book file. customer is the username of the
+    customer, interest_rate defaults to settings.INTEREST_RATE and approved
+    loans start on start_date (default now).
+    """
+    customer = serializers.CharField(max_length=150)
+
+    class Meta:
+        model = Loan
+        fields = (
+            "customer", "loan_type", "amount", "tenure", "interest_rate",
+            "status", "start_date", "amount_paid",
+        )
+        extra_kwargs = {"interest_rate": {"required": False}}
@@ -0,0 +1,72 @@
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from . import caching
+from .models import (
+    AGENT_GROUP, CustomerProfile, DailySummary, Loan, User, admin_group_cache_key,
+    group_cache_key,
+)
+
+
+def forget_admin_group(user_ids):
+    cache.delete_many([admin_group_cache_key(pk) for pk in user_ids])
+
+
+#Drop cached admin-group membership when a user's groups change
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        # user.groups.add/remove/clear(...)
+        if action in ("post_add", "post_remove", "post_clear"):
+            instance.__dict__.pop('_in_admin_group', None)
+            forget_admin_group([instance.pk])
+    elif action in ("post_add", "post_remove"):
+        # group.user_set.add/remove(...)
+        forget_admin_group(pk_set)
+    elif action == "pre_clear":
+        # group.user_set.clear(), members are only known before the clear
+        forget_admin_group(instance.user_set.values_list('pk', flat=True))
+
+
+#Renaming or deleting a group changes what its members resolve to
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    forget_admin_group(instance.user_set.values_list('pk', flat=True))
+    # A renamed group is only known by its new name here
+    cache.delete_many([
+        group_cache_key(name) for name in {instance.name, AGENT_GROUP}
+    ])
+
+
+#Keep the daily summary in step with single loan saves and deletes, the
+#FieldTracker still holds the previously saved values in post_save
+@receiver(post_save, sender=Loan)
+def loan_saved(sender, instance, created, raw=False, using=None, **kwargs):
+    if raw:
+        return
+    old = None if created else DailySummary.values_of(instance, saved=True)
+    new = DailySummary.values_of(instance)
+    if old != new:
+        DailySummary.move(old, new, using=using)
+
+
+@receiver(post_delete, sender=Loan)
+def loan_deleted(sender, instance, using=None, **kwargs):
+    DailySummary.move(DailySummary.values_of(instance, saved=True), using=using)
+
+
+#Skip the cached API responses that can show the saved or deleted row.
+#Logins only update last_login, which no response shows
+@receiver(post_save, sender=Loan)
+@receiver(post_delete, sender=Loan)
+@receiver(post_save, sender=CustomerProfile)
+@receiver(post_delete, sender=CustomerProfile)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_responses(sender, using=None, update_fields=None, **kwargs):
+    if update_fields and set(update_fields) <= {'last_login'}:
+        return
+    caching.invalidate(sender, using=using)
@@ -1,17 +1,55 @@
+import asyncio
+import datetime
+import io
 import json
-
-from django.test import TestCase, Client
+import os
+import random
+import tempfile
+from contextlib import ExitStack
+from decimal import Decimal
+from unittest import mock
+from urllib.parse import urlencode
+
+from asgiref.sync import async_to_sync
+from dateutil.relativedelta import relativedelta
+
+from django.conf import settings
+from django.db import DatabaseError, IntegrityError, connection, connections, transaction
+from django.db.utils import ConnectionHandler
+from django.test import AsyncClient, TestCase, TransactionTestCase, Client
+from django.test.utils import CaptureQueriesContext, override_settings
 from django.contrib.auth import get_user_model
 from django.contrib import auth
 from django.contrib.auth.models import Group, Permission
-
-from loan.models import CustomerProfile, Loan
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.utils import timezone
+
+from loan import amortization, caching
+from loan.forms import NewUserForm
+from loan.imports import CUSTOMERS, BookImporter
+from loan.models import (
+    CustomerProfile, DailySummary, ImportCheckpoint, Installment, Loan, LoanHistory,
+    Payment, summary_day,
+)
+from loan.authentication import make_token
+from loan.routers import STICKY_COOKIE
+from loan_managaement_system.asgi import ASGIHandler, application
 
 client = Client()
 
 
+# Replicas can not see the rows of the open transaction of a TestCase, see
+# TestReplicaRouting
+@override_settings(USE_READ_REPLICA=False)
 class TestMixin(TestCase):
 
+    def setUp(self):
+        # Cached roles are keyed by user id, which rolled back tests reuse
+        cache.clear()
+
     @classmethod
     def create_and_login_new_user(
         cls, login=True, username='newuser',
@@ -53,6 +91,33 @@ class TestMixin(TestCase):
             user = auth.get_user(client)
             assert user.is_authenticated
 
+    def assertQueryCountIsConstant(self, url, add_rows):
+        """
+        Asserts that rendering url runs the same number of queries
+        before and after add_rows() has created more rows
+        """
+        # Warm up per-user caches so both measured requests do the same work,
+        # with the response cache off so both are rendered
+        with override_settings(RESPONSE_CACHE_TIMEOUT=0):
+            client.get(url)
+
+            with CaptureQueriesContext(connection) as before:
+                response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+
+            add_rows()
+
+            with CaptureQueriesContext(connection) as after:
+                response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            len(before), len(after),
+            "Query count grew from %d to %d:\n%s" % (
+                len(before), len(after),
+                "\n".join(query["sql"] for query in after.captured_queries)
+            )
+        )
+
     def logout(self):
         """
         Helper method to logout user
@@ -355,7 +420,7 @@ class TestLoan(TestMixin):
                 "interest_rate": 8, "customer": self.customer2.id
             })
         )
-        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.status_code, 200)
         self.assertEqual(
             Loan.objects.get(id=self.loan_customer1.id).loan_type, "car"
         )
@@ -368,7 +433,7 @@ class TestLoan(TestMixin):
                 "interest_rate": 8, "customer": self.customer2.id
             })
         )
-        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.status_code, 200)
         self.assertEqual(
             Loan.objects.get(id=self.loan_customer2.id).loan_type, "personal"
         )
@@ -785,4 +850,1545 @@ class TestLoan(TestMixin):
         self.assertTrue(current_user.is_authenticated)
 
         response = client.get("/api/loan-requests/")
-        self.assertEqual(response.status_code, 200)
\ No newline at end of file
+        self.assertEqual(response.status_code, 200)
+    def test_0090_test_loan_list_pagination(self):
+        """
+        Check loan list is paginated with keyset cursors
+        """
+        loans = [self.loan_customer1, self.loan_customer2] + [
+            Loan.objects.create(
+                loan_type="car", amount=500, tenure=5, interest_rate=6,
+                customer=self.customer1
+            ) for i in range(3)
+        ]
+
+        self.login(username="agent")
+
+        response = client.get('/api/loan-requests/?page_size=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [loan.id for loan in response.data["loan_requests"]],
+            [loans[0].id, loans[1].id]
+        )
+        self.assertIsNone(response.data["pagination"]["previous_url"])
+
+        # Walk the remaining pages through the next links
+        seen = [loan.id for loan in response.data["loan_requests"]]
+        next_url = response.data["pagination"]["next_url"]
+        while next_url:
+            response = client.get(next_url)
+            self.assertEqual(response.status_code, 200)
+            seen += [loan.id for loan in response.data["loan_requests"]]
+            previous_url = response.data["pagination"]["previous_url"]
+            next_url = response.data["pagination"]["next_url"]
+        self.assertEqual(seen, [loan.id for loan in loans])
+
+        # Last page links back to the page before it
+        response = client.get(previous_url)
+        self.assertEqual(
+            [loan.id for loan in response.data["loan_requests"]],
+            [loans[2].id, loans[3].id]
+        )
+
+        response = client.get('/api/loan-requests/?cursor=invalid')
+        self.assertEqual(response.status_code, 404)
+
+    def test_0100_test_list_query_count(self):
+        """
+        Check loan and customer lists do not run a query per row
+        """
+        created = []
+
+        def add_customers_with_loans():
+            for i in range(len(created), len(created) + 3):
+                created.append(i)
+                user = self.create_and_login_new_user(
+                    username="extra%d" % i, login=False,
+                    email="extra%d@example.com" % i, role="customer"
+                )
+                customer = CustomerProfile.objects.create(
+                    user=user, phone=92333333, street_address="springhurst",
+                    zip_code=2301, city="noida", country="IN",
+                )
+                Loan.objects.create(
+                    loan_type="car", amount=500, tenure=5, interest_rate=6,
+                    customer=customer
+                )
+
+        self.login(username="agent")
+        self.assertQueryCountIsConstant(
+            '/api/loan-requests/', add_customers_with_loans
+        )
+        self.assertQueryCountIsConstant(
+            '/api/customers/', add_customers_with_loans
+        )
+
+    # The test process's cache stands in for one shared by the workers
+    @override_settings(SHARED_CACHE=True)
+    def test_0110_test_admin_role_is_cached(self):
+        """
+        Check admin group membership is cached and invalidated
+        """
+        User = get_user_model()
+        admin_group = Group.objects.create(name="Admin")
+
+        user = User.objects.get(id=self.agent_user.id)
+        with self.assertNumQueries(1):
+            self.assertFalse(user.is_admin())
+            self.assertFalse(user.is_admin())
+            self.assertEqual(user.role, "agent")
+
+        # Another request for the same user is answered from the cache
+        with self.assertNumQueries(0):
+            self.assertFalse(User(id=self.agent_user.id).is_admin())
+        # Unless the cache is per process, where other workers would miss
+        # the invalidation
+        with override_settings(SHARED_CACHE=False), self.assertNumQueries(1):
+            self.assertFalse(User(id=self.agent_user.id).is_admin())
+
+        admin_group.user_set.add(self.agent_user)
+        user = User.objects.get(id=self.agent_user.id)
+        self.assertTrue(user.is_admin())
+        self.assertEqual(user.role, "admin")
+
+        user.groups.remove(admin_group)
+        self.assertFalse(user.is_admin())
+        self.assertFalse(User.objects.get(id=self.agent_user.id).is_admin())
+
+    def test_0120_test_loan_list_date_filters(self):
+        """
+        Check loans can be filtered on start and end date ranges
+        """
+        Loan.objects.filter(id=self.loan_customer1.id).update(
+            start_date="2021-01-31T23:30:00Z", end_date="2021-06-30T23:30:00Z"
+        )
+        Loan.objects.filter(id=self.loan_customer2.id).update(
+            start_date="2021-02-01T00:00:00Z", end_date="2021-07-01T00:00:00Z"
+        )
+
+        self.login(username="agent")
+
+        def loan_ids(query):
+            response = client.get('/api/loan-requests/?%s' % query)
+            self.assertEqual(response.status_code, 200)
+            return [loan.id for loan in response.data["loan_requests"]]
+
+        first, second = self.loan_customer1.id, self.loan_customer2.id
+        self.assertEqual(loan_ids("start_date=2021-01-31"), [first])
+        self.assertEqual(loan_ids("start_date_after=2021-02-01"), [second])
+        self.assertEqual(loan_ids("start_date_before=2021-01-31"), [first])
+        self.assertEqual(
+            loan_ids("end_date_after=2021-06-01&end_date_before=2021-06-30"),
+            [first]
+        )
+        self.assertEqual(
+            loan_ids("end_date_after=2021-07-01&status=new"), [second]
+        )
+        self.assertEqual(loan_ids("end_date_before=2021-06-29"), [])
+
+        response = client.get('/api/loan-requests/?start_date_after=never')
+        self.assertEqual(response.status_code, 400)
+
+    def test_0130_test_seed_loans_command(self):
+        """
+        Check seed_loans bulk creates customers and loans
+        """
+        call_command(
+            'seed_loans', customers=5, loans=40, batch_size=16, seed=1,
+            stdout=io.StringIO()
+        )
+        self.assertEqual(CustomerProfile.objects.count(), 2 + 5)
+        self.assertEqual(Loan.objects.count(), 2 + 40)
+        self.assertEqual(
+            sum(DailySummary.objects.values_list("loans", flat=True)), 2 + 40
+        )
+
+        approved = Loan.objects.filter(status="approved").first()
+        self.assertEqual(approved.principal_amount, approved.amount)
+        self.assertEqual(
+            round(approved.emi, 6), round(approved.calculate_emi(), 6)
+        )
+        self.assertTrue(approved.customer.user.is_customer)
+
+    def test_0140_test_json_api(self):
+        """
+        Check loans and customers can be read and written as JSON
+        """
+        self.login(username="agent")
+
+        response = client.get('/api/loan-requests/?format=json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(
+            [loan["id"] for loan in response.json()["results"]],
+            [self.loan_customer1.id, self.loan_customer2.id]
+        )
+
+        response = client.get(
+            '/api/loan-requests/%d/' % self.loan_customer1.id,
+            HTTP_ACCEPT="application/json"
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["status"], "new")
+
+        response = client.post(
+            '/api/loan-requests/?format=json', content_type='application/json',
+            data=json.dumps({
+                "loan_type": "home", "amount": 1000, "tenure": 5,
+                "interest_rate": 4, "customer": self.customer1.id
+            })
+        )
+        self.assertEqual(response.status_code, 201)
+        loan_id = response.json()["id"]
+        self.assertEqual(Loan.objects.get(id=loan_id).customer, self.customer1)
+
+        response = client.put(
+            '/api/loan-requests/%d/?format=json' % loan_id,
+            content_type='application/json',
+            data=json.dumps({
+                "loan_type": "car", "amount": 1500, "tenure": 5,
+                "interest_rate": 6, "customer": self.customer1.id
+            })
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["loan_type"], "car")
+
+        # Read only fields are ignored on write
+        response = client.patch(
+            '/api/loan-requests/%d/?format=json' % loan_id,
+            content_type='application/json',
+            data=json.dumps({"status": "approved"})
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Loan.objects.get(id=loan_id).status, "new")
+
+        response = client.get('/api/customers/?format=json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["results"]), 2)
+
+        self.logout()
+        self.login(username="admin")
+
+        response = client.delete('/api/loan-requests/%d/?format=json' % loan_id)
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(Loan.objects.filter(id=loan_id).exists())
+
+    def test_0150_test_bulk_create_loan_api(self):
+        """
+        Check agents can create loan requests in bulk
+        """
+        rows = [
+            {"loan_type": "home", "amount": 1000, "tenure": 12, "customer": self.customer1.id},
+            {"loan_type": "boat", "amount": 1000, "tenure": 12, "customer": self.customer1.id},
+            {"loan_type": "car", "amount": 2000, "tenure": 24, "customer": 0},
+            {"loan_type": "personal", "amount": 500, "tenure": 6, "customer": self.customer2.id},
+        ]
+
+        # Only agents can upload loans
+        self.login(username="testuser1")
+        response = client.post(
+            '/api/loan-requests/bulk/', content_type='application/json',
+            data=json.dumps(rows)
+        )
+        self.assertEqual(response.status_code, 403)
+        self.logout()
+
+        self.login(username="agent")
+        response = client.post(
+            '/api/loan-requests/bulk/', content_type='application/json',
+            data=json.dumps(rows)
+        )
+        self.assertEqual(response.status_code, 207)
+        results = response.json()["results"]
+        self.assertEqual([result["row"] for result in results], [0, 1, 2, 3])
+        self.assertIn("loan_type", results[1]["errors"])
+        self.assertIn("customer", results[2]["errors"])
+
+        loan = Loan.objects.get(id=results[0]["id"])
+        self.assertEqual(loan.customer, self.customer1)
+        self.assertEqual(loan.interest_rate, 4)
+        self.assertEqual(loan.status, "new")
+        self.assertEqual(
+            Loan.objects.get(id=results[3]["id"]).interest_rate, 8
+        )
+
+        response = client.post(
+            '/api/loan-requests/bulk/', content_type='application/x-ndjson',
+            data="\n".join(json.dumps(row) for row in [rows[0], rows[3]])
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["created"], 2)
+        self.assertEqual(Loan.objects.count(), 2 + 2 + 2)
+
+    def test_0160_test_bulk_review_loan_api(self):
+        """
+        Check admin can approve and reject loan requests in bulk
+        """
+        paid_loan = Loan.objects.create(
+            loan_type="car", amount=1200, tenure=12, interest_rate=6,
+            amount_paid=200, customer=self.customer1
+        )
+        approved_loan = Loan.objects.create(
+            loan_type="car", amount=1200, tenure=12, interest_rate=6,
+            status="approved", customer=self.customer1
+        )
+        ids = [self.loan_customer1.id, paid_loan.id, approved_loan.id, 0]
+
+        # Only admin can review loans
+        self.login(username="agent")
+        response = client.post(
+            '/api/loan-requests/approve/', content_type='application/json',
+            data=json.dumps({"ids": ids})
+        )
+        self.assertEqual(response.status_code, 403)
+        self.logout()
+
+        self.login(username="admin")
+        response = client.post(
+            '/api/loan-requests/approve/', content_type='application/json',
+            data=json.dumps({"ids": ids})
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            "approved": [self.loan_customer1.id, paid_loan.id],
+            "skipped": [approved_loan.id],
+            "not_found": [0],
+        })
+
+        # Same outcome as approving through Loan.save
+        for loan in [self.loan_customer1, paid_loan]:
+            loan.refresh_from_db()
+            expected = Loan(
+                loan_type=loan.loan_type, amount=loan.amount,
+                tenure=loan.tenure, interest_rate=loan.interest_rate,
+                amount_paid=loan.amount_paid, status="approved",
+                customer=loan.customer
+            )
+            expected.save()
+            self.assertEqual(loan.status, "approved")
+            self.assertEqual(loan.principal_amount, expected.principal_amount)
+            self.assertEqual(loan.no_of_emi_left, expected.no_of_emi_left)
+            self.assertEqual(round(loan.emi, 6), round(expected.emi, 6))
+            self.assertEqual(
+                (loan.end_date - loan.start_date).days,
+                (expected.end_date - expected.start_date).days
+            )
+        self.assertEqual(
+            self.loan_customer1.start_date, paid_loan.start_date
+        )
+
+        # A saved loan that was paid before its approval is approved the
+        # same way by Loan.save and in bulk
+        loan = Loan.objects.create(
+            loan_type="car", amount=1200, tenure=12, interest_rate=6,
+            amount_paid=300, customer=self.customer1
+        )
+        fields = ("principal_amount", "financed_amount", "no_of_emi_left", "emi")
+        with transaction.atomic():
+            single = Loan.objects.get(id=loan.id)
+            single.status = "approved"
+            single.save()
+            single = Loan.objects.values(*fields).get(id=loan.id)
+            transaction.set_rollback(True)
+        Loan.objects.filter(id=loan.id).approve()
+        self.assertEqual(Loan.objects.values(*fields).get(id=loan.id), single)
+        self.assertEqual(
+            (single["principal_amount"], single["no_of_emi_left"]), (900, 11)
+        )
+
+        response = client.post(
+            '/api/loan-requests/reject/', content_type='application/json',
+            data=json.dumps({"ids": [self.loan_customer1.id, self.loan_customer2.id]})
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["rejected"], [self.loan_customer2.id])
+        self.assertEqual(response.json()["skipped"], [self.loan_customer1.id])
+        self.assertEqual(
+            Loan.objects.get(id=self.loan_customer2.id).status, "rejected"
+        )
+
+
+    def test_0170_test_repayment_schedule(self):
+        """
+        Check installments are generated on approval and extended later
+        """
+        loan = Loan.objects.create(
+            loan_type="home", amount=2400, tenure=24, interest_rate=4,
+            customer=self.customer1
+        )
+        self.assertFalse(loan.installments.exists())
+
+        loan.status = "approved"
+        loan.save()
+
+        # Only the first 12 months are generated on approval
+        installments = list(loan.installments.order_by("number"))
+        self.assertEqual([i.number for i in installments], list(range(1, 13)))
+        self.assertEqual(
+            installments[0].due_date,
+            (loan.start_date + relativedelta(months=1)).date()
+        )
+        self.assertEqual(installments[0].principal, 100)
+        self.assertEqual(installments[0].interest, 8)
+        self.assertEqual(installments[0].amount, loan.emi)
+        self.assertEqual(installments[11].balance, 1200)
+
+        # Payments lower principal_amount, later installments keep the split
+        # of the amount financed and carry on from the last balance
+        loan.post_payment(500)
+        self.assertEqual(loan.principal_amount, 1900)
+
+        # Extending is incremental and stops at the tenure
+        call_command(
+            "extend_schedules", months_ahead=18, stdout=io.StringIO()
+        )
+        self.assertEqual(loan.installments.count(), 18)
+        installments = list(loan.installments.filter(number__gt=12).order_by("number"))
+        self.assertEqual(
+            [(i.principal, i.interest, i.amount) for i in installments],
+            [(100, 8, loan.emi)] * 6
+        )
+        self.assertEqual(
+            [i.balance for i in installments], [1100, 1000, 900, 800, 700, 600]
+        )
+        loan.extend_schedule(loan.end_date.date() + relativedelta(years=1))
+        self.assertEqual(loan.installments.count(), 24)
+        self.assertEqual(loan.installments.get(number=24).balance, 0)
+
+        # Bulk approval generates schedules as well
+        Loan.objects.filter(id=self.loan_customer1.id).approve()
+        self.assertEqual(
+            Installment.objects.filter(loan=self.loan_customer1.id).count(), 5
+        )
+        due = self.loan_customer1.installments.get(number=1).due_date
+        self.assertEqual(
+            set(Installment.objects.filter(due_date=due).values_list("loan", flat=True)),
+            {loan.id, self.loan_customer1.id}
+        )
+
+    def test_0180_test_payment_ledger(self):
+        """
+        Check payments are appended to the ledger and update the loan
+        """
+        loan = Loan.objects.create(
+            loan_type="home", amount=2400, tenure=24, interest_rate=4,
+            customer=self.customer1
+        )
+        loan.status = "approved"
+        loan.save()
+        self.assertEqual(loan.emi, 108)
+        url = '/api/loan-requests/%d/payments/' % loan.id
+
+        # Customers can not record payments, not even on their own loan
+        for username in ["testuser1", "testuser2"]:
+            self.login(username=username)
+            response = client.post(url, {"amount": 108})
+            self.assertEqual(response.status_code, 403)
+            self.logout()
+
+        self.login(username="admin")
+        response = client.post(url, {"amount": 108, "reference": "upi-1"})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["loan"]["no_of_emi_left"], 23)
+        self.logout()
+
+        self.login(username="agent")
+        response = client.post(url, {"amount": 200})
+        self.assertEqual(response.status_code, 201)
+        for amount in [0, 3000]:
+            response = client.post(url, {"amount": amount})
+            self.assertEqual(response.status_code, 400)
+        response = client.post(
+            '/api/loan-requests/%d/payments/' % self.loan_customer1.id,
+            {"amount": 100}
+        )
+        self.assertEqual(response.status_code, 400)
+
+        response = client.get(url)
+        self.assertEqual(
+            [(p["amount"], p["reference"]) for p in response.json()],
+            [("108.0000000000", "upi-1"), ("200.0000000000", "")]
+        )
+        self.logout()
+
+        # The customer reads the ledger of their own loan only
+        self.login(username="testuser1")
+        self.assertEqual(len(client.get(url).json()), 2)
+        self.logout()
+        self.login(username="testuser2")
+        self.assertEqual(client.get(url).status_code, 404)
+        self.logout()
+
+        loan.refresh_from_db()
+        self.assertEqual(loan.amount_paid, 308)
+        self.assertEqual(loan.principal_amount, 2092)
+        self.assertEqual(loan.no_of_emi_left, 22)
+        self.assertEqual(loan.emi, 108)
+
+        # Saving the loan again keeps the ledger totals
+        loan = Loan.objects.get(id=loan.id)
+        loan.save()
+        loan.refresh_from_db()
+        self.assertEqual(loan.no_of_emi_left, 22)
+
+        payment = Payment.objects.filter(loan=loan).first()
+        payment.amount = 1
+        with self.assertRaises(ValidationError):
+            payment.save()
+
+
+    def test_0190_test_loan_history(self):
+        """
+        Check edits are kept as deltas and a loan can be rebuilt at any time
+        """
+        loan = self.loan_customer1
+        url = '/api/loan-requests/%d/history/' % loan.id
+        before_edit = timezone.now()
+
+        self.login(username="agent")
+        response = client.post(
+            '/api/loan-requests/%d/edit/' % loan.id,
+            content_type='application/json',
+            data=json.dumps({
+                "loan_type": "car", "amount": 1200, "tenure": 5,
+                "interest_rate": 8, "customer": self.customer1.id
+            })
+        )
+        self.assertEqual(response.status_code, 200)
+        self.logout()
+        before_approval = timezone.now()
+
+        Loan.objects.filter(id=loan.id).approve()
+        before_payment = timezone.now()
+        Loan.objects.get(id=loan.id).post_payment(100)
+
+        self.login(username="testuser1")
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        history = response.json()
+        self.assertEqual(len(history), 3)
+        self.assertEqual(
+            history[0]["changes"],
+            {"loan_type": "home", "amount": "1000.0000000000"}
+        )
+        self.assertEqual(history[1]["changes"]["status"], "new")
+        self.assertEqual(history[2]["changes"]["amount_paid"], None)
+
+        response = client.get(url, {"at": before_edit.isoformat()})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            (response.json()["loan_type"], response.json()["amount"]),
+            ("home", "1000.0000000000")
+        )
+
+        response = client.get(url, {"at": before_approval.isoformat()})
+        self.assertEqual(
+            (response.json()["status"], response.json()["amount"]),
+            ("new", "1200.0000000000")
+        )
+        self.assertIsNone(response.json()["start_date"])
+
+        response = client.get(url, {"at": before_payment.isoformat()})
+        self.assertEqual(response.json()["status"], "approved")
+        self.assertEqual(response.json()["no_of_emi_left"], 5)
+        self.assertIsNone(response.json()["amount_paid"])
+
+        response = client.get(url, {"at": "2000-01-01T00:00:00Z"})
+        self.assertEqual(response.status_code, 404)
+        response = client.get(url, {"at": "yesterday"})
+        self.assertEqual(response.status_code, 400)
+        self.logout()
+
+        self.login(username="testuser2")
+        self.assertEqual(client.get(url).status_code, 404)
+        self.logout()
+
+        # An edit whose history row can not be saved is not saved either
+        loan = Loan.objects.get(id=loan.id)
+        loan.tenure = 12
+        with mock.patch.object(LoanHistory, "save", side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                loan.save()
+        self.assertEqual(Loan.objects.get(id=loan.id).tenure, 5)
+
+    def test_0200_test_detail_views_fetch_once(self):
+        """
+        Check edit/update/retrieve load their object with a single query
+        """
+        def fetches(table, method, url, **kwargs):
+            with CaptureQueriesContext(connection) as queries:
+                response = method(url, **kwargs)
+            self.assertIn(response.status_code, [200, 201])
+            return len([
+                query for query in queries.captured_queries
+                # Object loads, not the unique checks of validation
+                if query["sql"].startswith('SELECT "loan_basemodel"') and
+                'FROM "%s"' % table in query["sql"]
+            ])
+
+        self.login(username="agent")
+        loan_url = '/api/loan-requests/%d/' % self.loan_customer1.id
+        data = json.dumps({
+            "loan_type": "car", "amount": 1000, "tenure": 5,
+            "interest_rate": 8, "customer": self.customer1.id
+        })
+        self.assertEqual(fetches(
+            "loan_loan", client.post, loan_url + "edit/",
+            content_type='application/json', data=data
+        ), 1)
+        self.assertEqual(fetches("loan_loan", client.get, loan_url), 1)
+        self.assertEqual(fetches(
+            "loan_loan", client.put, loan_url + "?format=json",
+            content_type='application/json', data=data
+        ), 1)
+
+        customer_url = '/api/customers/%d/' % self.customer1.id
+        data = json.dumps({
+            "phone": 92333334, "street_address": "spring creek",
+            "zip_code": 2301, "city": "delhi", "country": "IN",
+            "user": self.test_user1.id,
+        })
+        self.assertEqual(fetches(
+            "loan_customerprofile", client.post, customer_url + "edit/",
+            content_type='application/json', data=data
+        ), 1)
+        self.assertEqual(fetches("loan_customerprofile", client.get, customer_url), 1)
+        self.assertEqual(
+            CustomerProfile.objects.get(id=self.customer1.id).city, "delhi"
+        )
+        self.logout()
+
+    def test_0210_test_portfolio_reports(self):
+        """
+        Check the portfolio reports aggregate and filter loans
+        """
+        CustomerProfile.objects.filter(id=self.customer2.id).update(country="US")
+        self.login(username="agent")
+        response = client.post(
+            '/api/loan-requests/bulk/', content_type='application/json',
+            data=json.dumps([
+                {"loan_type": "home", "amount": 1200, "tenure": 12, "customer": self.customer1.id},
+                {"loan_type": "home", "amount": 2400, "tenure": 12, "customer": self.customer2.id},
+                {"loan_type": "car", "amount": 600, "tenure": 6, "customer": self.customer1.id},
+            ])
+        )
+        ids = [result["id"] for result in response.json()["results"]]
+        self.logout()
+        Loan.objects.filter(id__in=ids[:2]).approve()
+        Loan.objects.filter(id=ids[2]).reject()
+
+        # Reports are for admins only
+        self.login(username="agent")
+        self.assertEqual(client.get('/api/reports/loan-types/').status_code, 403)
+        self.logout()
+
+        self.login(username="admin")
+        response = client.get('/api/reports/loan-types/')
+        self.assertEqual(response.status_code, 200)
+        home, personal = response.json()[1], response.json()[2]
+        self.assertEqual(
+            (home["loan_type"], home["loans"], home["new"], home["approved"]),
+            ("home", 3, 1, 2)
+        )
+        self.assertEqual(home["outstanding_principal"], 3600)
+        self.assertEqual(home["monthly_emi"], 312)
+        self.assertEqual(personal["loans"], 1)
+
+        response = client.get('/api/reports/loan-types/', {"country": "US"})
+        self.assertEqual(
+            [(row["loan_type"], row["total_amount"]) for row in response.json()],
+            [("home", 2400), ("personal", 2000)]
+        )
+        response = client.get(
+            '/api/reports/loan-types/', {"status": "approved", "loan_type": "home"}
+        )
+        self.assertEqual(len(response.json()), 1)
+        self.assertEqual(response.json()[0]["loans"], 2)
+
+        response = client.get('/api/reports/agents/')
+        self.assertEqual(response.json(), [{
+            "agent": self.agent_user.id, "username": "agent", "loans": 3,
+            "new": 0, "approved": 2, "rejected": 1, "approval_rate": 2 / 3,
+        }])
+
+        response = client.get('/api/reports/emi/', {"country": "IN"})
+        months = response.json()
+        self.assertEqual(len(months), 12)
+        self.assertEqual(
+            (months[0]["installments"], months[0]["emi"]), (1, 104)
+        )
+
+        # Months past the generated schedules are reported as well, the
+        # report does not read the installments
+        Loan.objects.create(
+            loan_type="car", amount=3600, tenure=36, interest_rate=6,
+            customer=self.customer1, status="approved"
+        )
+        Installment.objects.all().delete()
+        months = client.get('/api/reports/emi/', {"country": "IN"}).json()
+        self.assertEqual(len(months), 36)
+        self.assertEqual(
+            [
+                (month["installments"], month["principal"], month["interest"])
+                for month in (months[0], months[11], months[12], months[35])
+            ],
+            [(2, 200, 22), (2, 200, 22), (1, 100, 18), (1, 100, 18)]
+        )
+        self.assertEqual(
+            months[12]["month"],
+            (timezone.now() + relativedelta(months=13)).strftime("%Y-%m-01")
+        )
+        self.logout()
+
+    def test_0220_test_daily_summary(self):
+        """
+        Check the daily summary follows every kind of loan change and
+        matches a full rebuild
+        """
+        def summary():
+            return sorted(
+                DailySummary.objects.filter(loans__gt=0).values_list(
+                    "day", "loan_type", "status", "loans", "amount",
+                    "principal_amount", "emi", "amount_paid"
+                )
+            )
+
+        loan = Loan.objects.create(
+            loan_type="car", amount=1200, tenure=12, interest_rate=6,
+            customer=self.customer1
+        )
+        loan = Loan.objects.get(id=loan.id)
+        loan.loan_type = "home"
+        loan.save()
+        loan.status = "approved"
+        loan.save()
+        loan.post_payment(100)
+        with CaptureQueriesContext(connection) as queries:
+            Loan.objects.filter(id=self.loan_customer1.id).approve()
+            Loan.objects.filter(id=self.loan_customer2.id).reject()
+
+            self.login(username="agent")
+            client.post(
+                '/api/loan-requests/bulk/', content_type='application/json',
+                data=json.dumps([
+                    {"loan_type": "car", "amount": 500, "tenure": 6, "customer": self.customer1.id},
+                ])
+            )
+            self.logout()
+        # Bulk writes update the summary rows they change, no rebuild
+        self.assertFalse([
+            query["sql"] for query in queries.captured_queries
+            if query["sql"].startswith('DELETE FROM "loan_dailysummary"')
+        ])
+        Loan.objects.filter(loan_type="car").delete()
+
+        incremental = summary()
+        self.assertEqual(
+            [row[1:4] for row in incremental],
+            [("home", "approved", 2), ("personal", "rejected", 1)]
+        )
+        self.assertEqual(incremental[0][7], 100)
+        call_command("rebuild_daily_summary", stdout=io.StringIO())
+        self.assertEqual(summary(), incremental)
+        DailySummary.rebuild(days={summary_day(loan.created)})
+        self.assertEqual(summary(), incremental)
+
+        self.login(username="admin")
+        response = client.get('/api/reports/daily/', {"status": "approved"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 1)
+        self.assertEqual(response.json()[0]["amount"], 2200)
+        response = client.get('/api/reports/daily/', {"day_after": "yesterday"})
+        self.assertEqual(response.status_code, 400)
+        self.logout()
+
+    def test_0230_test_streaming_exports(self):
+        """
+        Check loans and customers can be exported as CSV and NDJSON
+        """
+        Loan.objects.filter(id=self.loan_customer2.id).approve()
+
+        self.login(username="agent")
+        response = client.get('/api/loan-requests/export/')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(",")[:3], ["id", "customer", "loan_type"])
+        self.assertEqual(len(lines), 3)
+
+        response = client.get(
+            '/api/loan-requests/export/', {"type": "ndjson", "status": "approved"}
+        )
+        self.assertEqual(response["Content-Type"], "application/x-ndjson")
+        rows = [
+            json.loads(line) for line in
+            b"".join(response.streaming_content).decode().splitlines()
+        ]
+        self.assertEqual([row["id"] for row in rows], [self.loan_customer2.id])
+        self.assertEqual(rows[0]["amount"], "2000.0000000000")
+        self.assertIsNotNone(rows[0]["start_date"])
+
+        response = client.get('/api/loan-requests/export/', {"type": "xlsx"})
+        self.assertEqual(response.status_code, 400)
+
+        response = client.get('/api/customers/export/', {"type": "ndjson"})
+        rows = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(
+            [json.loads(row)["username"] for row in rows], ["testuser1", "testuser2"]
+        )
+        self.logout()
+
+        # Customers only export their own loans
+        self.login(username="testuser1")
+        response = client.get('/api/loan-requests/export/', {"type": "ndjson"})
+        rows = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(
+            [json.loads(row)["id"] for row in rows], [self.loan_customer1.id]
+        )
+        self.logout()
+
+        out = io.StringIO()
+        call_command(
+            "export_loans", type="csv", filters=["status=new"], stdout=out,
+            stderr=io.StringIO()
+        )
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertTrue(lines[1].startswith("%d," % self.loan_customer1.id))
+
+    def test_0240_test_import_book(self):
+        """
+        Check customers and loans are imported in chunks and resumed from
+        the checkpoint
+        """
+        directory = tempfile.mkdtemp()
+        customers = os.path.join(directory, "customers.csv")
+        loans = os.path.join(directory, "loans.ndjson")
+        with open(customers, "w") as f:
+            f.write(
+                "username,email,first_name,last_name,password,phone,street_address,zip_code,city,country\n"
+                "partner1,p1@example.com,Partner,One,secret123,9111111111,1 Road,110001,delhi,IN\n"
+                "partner2,,Partner,Two,,9222222222,2 Road,110002,delhi,XX\n"
+                "testuser1,,Test,User,,9333333333,3 Road,110003,noida,IN\n"
+                "partner3,,Partner,Three,,9444444444,4 Road,110004,mumbai,IN\n"
+            )
+        with open(loans, "w") as f:
+            for row in [
+                {"customer": "partner1", "loan_type": "home", "amount": 1200, "tenure": 12},
+                {"customer": "partner3", "loan_type": "car", "amount": 600, "tenure": 6,
+                 "status": "approved", "start_date": "2021-01-15T00:00:00Z"},
+                {"customer": "nobody", "loan_type": "car", "amount": 600, "tenure": 6},
+                {"customer": "partner1", "loan_type": "boat", "amount": 600, "tenure": 6},
+            ]:
+                f.write(json.dumps(row) + "\n")
+            f.write("{not json\n")
+
+        errors = os.path.join(directory, "errors.ndjson")
+        out = io.StringIO()
+        call_command(
+            "import_book", customers=customers, loans=loans, chunk_size=2,
+            workers=2, errors=errors, stdout=out
+        )
+        self.assertIn("Imported 2 customers, 2 rejected", out.getvalue())
+        self.assertIn("Imported 2 loans, 3 rejected", out.getvalue())
+        with open(errors) as f:
+            rejected = [json.loads(line) for line in f]
+        self.assertEqual(
+            sorted((row["source"], row["row"]) for row in rejected),
+            [("customers", 1), ("customers", 2), ("loans", 2), ("loans", 3), ("loans", 4)]
+        )
+
+        partner = get_user_model().objects.get(username="partner1")
+        self.assertTrue(partner.check_password("secret123"))
+        self.assertTrue(partner.is_customer)
+        self.assertFalse(
+            get_user_model().objects.get(username="partner3").has_usable_password()
+        )
+        self.assertEqual(partner.customer.city, "delhi")
+
+        loan = Loan.objects.get(customer__user__username="partner3")
+        self.assertEqual(loan.interest_rate, 6)
+        self.assertEqual(loan.emi, 103)
+        self.assertEqual(loan.installments.count(), 6)
+        self.assertEqual(
+            DailySummary.objects.get(
+                loan_type="car", status="approved"
+            ).amount, 600
+        )
+
+        # Running the job again only picks up rows after the checkpoint
+        call_command(
+            "import_book", customers=customers, loans=loans, workers=0,
+            errors=errors, stdout=io.StringIO()
+        )
+        self.assertEqual(Loan.objects.count(), 2 + 2)
+
+        ImportCheckpoint.objects.filter(source="loans").update(position=1)
+        call_command(
+            "import_book", customers=customers, loans=loans, workers=0,
+            errors=errors, stdout=io.StringIO()
+        )
+        self.assertEqual(Loan.objects.count(), 2 + 3)
+        self.assertEqual(
+            Loan.objects.filter(customer__user__username="partner3").count(), 2
+        )
+
+        # Rows rejected in a chunk that fails are reported on the retry only
+        with open(customers, "w") as f:
+            f.write(
+                "username,first_name,last_name,phone,street_address,zip_code,city,country\n"
+                "partner4,Partner,Four,9555555555,5 Road,110005,delhi,IN\n"
+                "bad name!,Bad,Name,9666666666,6 Road,110006,delhi,IN\n"
+            )
+        reported = []
+        importer = BookImporter(
+            "retry", on_error=lambda source, row, detail: reported.append((row, list(detail)))
+        )
+        ImportCheckpoint.objects.create(job="retry", source=CUSTOMERS)
+        with mock.patch.object(ImportCheckpoint, "save", side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                importer.run(CUSTOMERS, customers)
+        self.assertEqual(reported, [])
+        self.assertFalse(get_user_model().objects.filter(username="partner4"))
+        self.assertEqual(
+            importer.run(CUSTOMERS, customers), {"imported": 1, "failed": 1}
+        )
+        self.assertEqual(reported, [(1, ["username"])])
+        importer.close()
+
+    def test_0250_test_signup_pipeline(self):
+        """
+        Check signups reuse the cached agent group and create the user and
+        the profile together
+        """
+        User = get_user_model()
+
+        def signup(username, role="agent"):
+            return {
+                "first_name": "lucky", "last_name": "raja", "username": username,
+                "email": "%s@example.com" % username, "password1": "getshitdone",
+                "password2": "getshitdone", "role": role, "phone": 126777733,
+                "street_address": "test", "zip_code": 12223, "city": "noida",
+                "country": "IN",
+            }
+
+        client.post('/register', signup("agent-one"))
+        with CaptureQueriesContext(connection) as queries:
+            response = client.post('/register', signup("agent-two"))
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse([
+            query for query in queries.captured_queries
+            if query["sql"].startswith("SELECT") and 'FROM "auth_group"' in query["sql"]
+        ])
+        agents = Group.objects.get(name="Agent").user_set
+        self.assertTrue(agents.filter(username="agent-two").exists())
+        self.assertTrue(
+            User.objects.get(username="agent-two").check_password("getshitdone")
+        )
+
+        # Renaming the group drops the cached id
+        Group.objects.filter(name="Agent").update(name="Old agents")
+        Group.objects.get(name="Old agents").save()
+        new_group = Group.objects.create(name="Agent")
+        client.post('/register', signup("agent-three"))
+        self.assertTrue(new_group.user_set.filter(username="agent-three").exists())
+
+        # A profile that can not be saved leaves no user behind
+        form = NewUserForm(signup("customer-one", role="customer"))
+        self.assertTrue(form.is_valid())
+        form.cleaned_data["phone"] = None
+        with self.assertRaises(IntegrityError):
+            form.save()
+        self.assertFalse(User.objects.filter(username="customer-one").exists())
+
+    def test_0260_test_async_read_endpoints(self):
+        """
+        Check the async routes answer like the sync API, scoped by role
+        """
+        async_client = AsyncClient()
+
+        @async_to_sync
+        async def get(url, **params):
+            # Django 3.2's AsyncClient drops the data of GET requests
+            return await async_client.get("%s?%s" % (url, urlencode(params)))
+
+        loans_url = '/api/async/loan-requests/'
+        customers_url = '/api/async/customers/'
+        response = get(loans_url)
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(
+            response.json(),
+            {"detail": "Authentication credentials were not provided."}
+        )
+
+        for username in ["admin", "agent", "testuser1"]:
+            user = get_user_model().objects.get(username=username)
+            async_client.force_login(user)
+            self.login(user=user)
+            for url, params in [
+                (loans_url, {}),
+                (loans_url, {"loan_type": "personal", "page_size": 1}),
+                (loans_url + "%d/" % self.loan_customer1.id, {}),
+                (customers_url, {"city": "noida"}),
+                (customers_url + "%d/" % self.customer1.id, {}),
+            ]:
+                response = get(url, **params)
+                self.assertEqual(response.status_code, 200, url)
+                expected = client.get(
+                    url.replace("/async", ""), dict(params, format="json")
+                )
+                data, expected = response.json(), expected.json()
+                if "results" in data:
+                    # Page links point back at their own route
+                    self.assertEqual(
+                        [bool(data["next"]), bool(data["previous"])],
+                        [bool(expected["next"]), bool(expected["previous"])]
+                    )
+                    data, expected = data["results"], expected["results"]
+                self.assertEqual(data, expected, url)
+
+        # Customers only reach their own records
+        self.assertEqual(
+            [loan["id"] for loan in get(loans_url).json()["results"]],
+            [self.loan_customer1.id]
+        )
+        self.assertEqual(
+            get(loans_url + "%d/" % self.loan_customer2.id).status_code, 404
+        )
+        self.assertEqual(
+            get(customers_url + "%d/" % self.customer2.id).status_code, 404
+        )
+        self.assertEqual(get(loans_url, cursor="nope").status_code, 404)
+        self.assertEqual(get(loans_url, status="unknown").status_code, 400)
+        self.assertEqual(client.post(loans_url).status_code, 405)
+        self.logout()
+
+    # The test process's cache stands in for one shared by the workers
+    @override_settings(SHARED_CACHE=True)
+    def test_0270_test_response_cache(self):
+        """
+        Check list/retrieve responses are cached per user and URL and
+        dropped as soon as a loan, customer or user changes
+        """
+        loans_url = '/api/loan-requests/?format=json'
+
+        def get(url):
+            response = client.get(url)
+            self.assertEqual(response.status_code, 200)
+            return response["X-Cache"], response.content
+
+        self.login(username="agent")
+        miss = client.get(loans_url)
+        self.assertEqual(miss["X-Cache"], "MISS")
+        content = miss.content
+        with CaptureQueriesContext(connection) as queries:
+            hit = client.get(loans_url)
+        self.assertEqual((hit["X-Cache"], hit.content), ("HIT", content))
+        for header in ("Content-Type", "Allow", "Vary"):
+            self.assertEqual(hit[header], miss[header], header)
+        self.assertFalse([
+            query for query in queries.captured_queries
+            if "loan_loan" in query["sql"]
+        ])
+        self.assertEqual(get(loans_url + "&loan_type=home")[0], "MISS")
+        self.assertEqual(
+            get('/api/customers/%d/?format=json' % self.customer1.id)[0], "MISS"
+        )
+
+        # Logging in again only updates last_login
+        self.login(username="agent")
+        self.assertEqual(get(loans_url)[0], "HIT")
+
+        # Each user has their own entries
+        self.login(username="testuser1")
+        miss, content = get(loans_url)
+        self.assertEqual(miss, "MISS")
+        self.assertEqual(
+            [loan["id"] for loan in json.loads(content)["results"]],
+            [self.loan_customer1.id]
+        )
+
+        # Approvals are bulk updates without signals
+        Loan.objects.filter(id=self.loan_customer1.id).approve()
+        miss, content = get(loans_url)
+        self.assertEqual(miss, "MISS")
+        self.assertEqual(json.loads(content)["results"][0]["status"], "approved")
+        self.assertEqual(get(loans_url)[0], "HIT")
+
+        # The list shows customer fields
+        CustomerProfile.objects.get(id=self.customer1.id).save()
+        self.assertEqual(get(loans_url)[0], "MISS")
+
+        # Forms carry a CSRF token and are rendered every time
+        form_url = '/api/loan-requests/%d/' % self.loan_customer1.id
+        self.assertEqual(get(form_url)[0], "MISS")
+        self.assertEqual(get(form_url)[0], "MISS")
+        self.logout()
+
+        out = io.StringIO()
+        call_command("response_cache_stats", "--reset", stdout=out)
+        self.assertEqual(
+            json.loads(out.getvalue()), {"hits": 3, "misses": 8, "hit_rate": 0.2727}
+        )
+        self.assertEqual(caching.stats()["hits"], 0)
+
+        # A per process cache would miss the invalidations of other workers
+        self.login(username="agent")
+        with override_settings(SHARED_CACHE=False):
+            self.assertNotIn("X-Cache", client.get(loans_url))
+        self.logout()
+
+    def test_0280_test_signed_token_auth(self):
+        """
+        Check API clients authenticate with signed tokens, without session
+        or user queries and without CSRF
+        """
+        api = Client(enforce_csrf_checks=True)
+
+        def token_for(username):
+            response = api.post('/api/token/', {
+                "username": username, "password": "password"
+            })
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json()["expires_in"], 300)
+            return response.json()["token"]
+
+        self.assertEqual(api.post('/api/token/', {
+            "username": "testuser1", "password": "wrong"
+        }).status_code, 400)
+
+        token = token_for("testuser1")
+        bearer = {"HTTP_AUTHORIZATION": "Bearer %s" % token}
+        with CaptureQueriesContext(connection) as queries:
+            response = api.get('/api/loan-requests/?format=json', **bearer)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [loan["id"] for loan in response.json()["results"]],
+            [self.loan_customer1.id]
+        )
+        self.assertFalse([
+            query["sql"] for query in queries.captured_queries
+            if "auth_user" in query["sql"] or "django_session" in query["sql"]
+        ])
+
+        # Writes need no CSRF token
+        response = api.post(
+            '/api/loan-requests/?format=json', content_type='application/json',
+            data=json.dumps({"loan_type": "car", "amount": 500, "tenure": 5}),
+            **bearer
+        )
+        self.assertEqual(response.status_code, 201)
+        loan = Loan.objects.get(id=response.json()["id"])
+        self.assertEqual(loan.customer, self.customer1)
+        self.assertEqual(loan.created_by, self.test_user1)
+
+        # Role claims
+        response = api.get(
+            '/api/loan-requests/?format=json',
+            HTTP_AUTHORIZATION="Bearer %s" % token_for("agent")
+        )
+        self.assertEqual(len(response.json()["results"]), 3)
+        @async_to_sync
+        async def async_get(url):
+            # Django 3.2's AsyncClient takes extra headers by their ASGI name
+            return await AsyncClient().get(url, authorization="Bearer %s" % token)
+
+        response = async_get('/api/async/loan-requests/')
+        self.assertEqual(len(response.json()["results"]), 2)
+
+        # Forged and expired tokens
+        response = api.get(
+            '/api/loan-requests/?format=json',
+            HTTP_AUTHORIZATION="Bearer %sx" % token
+        )
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.json(), {"detail": "Invalid token."})
+        with override_settings(API_TOKEN_MAX_AGE=-1):
+            response = api.get('/api/loan-requests/?format=json', **bearer)
+        self.assertEqual(response.json(), {"detail": "Token has expired."})
+
+        # Refreshing reloads the user
+        response = api.post('/api/token/refresh/', **bearer)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["role"], "customer")
+        User = get_user_model()
+        User.objects.filter(username="testuser1").update(is_active=False)
+        response = api.post('/api/token/refresh/', **bearer)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(response["WWW-Authenticate"], "Bearer")
+
+    def test_0290_test_session_modes(self):
+        """
+        Check cached and signed cookie sessions spare the session queries of
+        page views, and expired sessions are purged in batches
+        """
+        def session_queries(browser):
+            with CaptureQueriesContext(connection) as queries:
+                response = browser.get('/api/loan-requests/?format=json')
+            self.assertEqual(response.status_code, 200)
+            return [
+                query["sql"] for query in queries.captured_queries
+                if "django_session" in query["sql"]
+            ]
+
+        self.assertEqual(
+            settings.SESSION_ENGINE, "django.contrib.sessions.backends.cached_db"
+        )
+        browser = Client()
+        browser.login(username="agent", password="password")
+        self.assertFalse(session_queries(browser))
+        cache.clear()
+        self.assertEqual(len(session_queries(browser)), 1)
+        self.assertFalse(session_queries(browser))
+
+        with override_settings(
+            SESSION_ENGINE="django.contrib.sessions.backends.signed_cookies"
+        ):
+            browser = Client()
+            browser.login(username="agent", password="password")
+            self.assertFalse(session_queries(browser))
+            out = io.StringIO()
+            call_command("purge_sessions", stdout=out)
+            self.assertIn("keeps no sessions", out.getvalue())
+
+        now = timezone.now()
+        Session.objects.bulk_create([
+            Session(
+                session_key="expired%d" % number, session_data="",
+                expire_date=now - datetime.timedelta(days=1)
+            )
+            for number in range(5)
+        ] + [
+            Session(
+                session_key="live%d" % number, session_data="",
+                expire_date=now + datetime.timedelta(days=1)
+            )
+            for number in range(2)
+        ])
+        out = io.StringIO()
+        call_command("purge_sessions", "--batch-size", "2", stdout=out)
+        self.assertEqual(
+            out.getvalue(), "Deleted 5 expired sessions in 3 batches\n"
+        )
+        self.assertFalse(Session.objects.filter(session_key__startswith="expired"))
+        self.assertEqual(
+            Session.objects.filter(session_key__startswith="live").count(), 2
+        )
+
+    def test_0300_test_load_test_support(self):
+        """
+        Check seed_loans creates agents and admins with a known prefix, and
+        requests answer their query count when asked to
+        """
+        call_command(
+            'seed_loans', customers=2, loans=4, agents=2, admins=1,
+            prefix="load-", seed=1, stdout=io.StringIO()
+        )
+        User = get_user_model()
+        self.assertEqual(
+            {user.username: user.role for user in User.objects.filter(
+                username__startswith="load-"
+            )},
+            {
+                "load-0": "customer", "load-1": "customer",
+                "load-agent0": "agent", "load-agent1": "agent",
+                "load-admin0": "admin",
+            }
+        )
+        self.assertTrue(User.objects.get(username="load-agent1").is_staff)
+
+        browser = Client()
+        self.assertTrue(browser.login(username="load-agent0", password="password"))
+        response = browser.get('/api/loan-requests/?format=json')
+        self.assertNotIn("X-Query-Count", response)
+        with override_settings(QUERY_COUNT_HEADER=True, RESPONSE_CACHE_TIMEOUT=0):
+            with CaptureQueriesContext(connection) as queries:
+                response = browser.get('/api/loan-requests/?format=json')
+        self.assertEqual(len(response.json()["results"]), Loan.objects.count())
+        self.assertEqual(int(response["X-Query-Count"]), len(queries))
+
+class TestAmortization(TestMixin):
+
+    def test_0010_test_flat_emi_matches_loan(self):
+        """
+        Check vectorized flat EMIs match Loan.calculate_emi to the cent
+        """
+        rng = random.Random(1)
+        loans = [
+            Loan(
+                principal_amount=Decimal(rng.randrange(100000, 10 ** 9)) / 100,
+                interest_rate=Decimal(rng.choice([4, 6, 8, 7.5])),
+                tenure=rng.randrange(1, 361)
+            )
+            for i in range(1000)
+        ]
+        emis = amortization.to_cents(amortization.flat_emi(
+            [float(loan.principal_amount) for loan in loans],
+            [float(loan.interest_rate) for loan in loans],
+            [loan.tenure for loan in loans],
+        ))
+        for loan, emi in zip(loans, emis):
+            self.assertEqual(
+                Decimal(str(emi)), loan.calculate_emi().quantize(Decimal("0.01"))
+            )
+
+    def test_0020_test_schedules(self):
+        """
+        Check flat and reducing balance schedules repay the principal
+        """
+        principal, rate, tenure = [1000, 250000, 5000], [8, 4, 0], [5, 240, 12]
+        for method in amortization.METHODS:
+            schedule = amortization.schedule(principal, rate, tenure, method)
+            self.assertEqual(schedule["emi"].shape, (3, 240))
+            self.assertEqual(
+                list(amortization.to_cents(schedule["principal"].sum(axis=1))),
+                principal
+            )
+            self.assertEqual(list(schedule["balance"][:, -1]), [0, 0, 0])
+            self.assertEqual(schedule["emi"][0, 5], 0)
+
+        # 250000 at 4% over 20 years
+        schedule = amortization.schedule(principal, rate, tenure, "reducing")
+        self.assertEqual(amortization.to_cents(schedule["emi"][1, 0]), 1514.95)
+        self.assertEqual(
+            amortization.to_cents(schedule["interest"][1, 0]), 833.33
+        )
+        self.assertEqual(
+            amortization.to_cents(schedule["balance"][1, 0]), 249318.38
+        )
+
+    def test_0030_test_backtest_rate_change(self):
+        """
+        Check a rate change is priced for every loan of a queryset
+        """
+        user = self.create_and_login_new_user(login=False, role="customer")
+        customer = CustomerProfile.objects.create(
+            user=user, phone=92333333, street_address="spring creek",
+            zip_code=2301, city="noida", country="IN",
+        )
+        loans = [
+            Loan.objects.create(
+                loan_type="home", amount=1200, tenure=12, interest_rate=4,
+                customer=customer
+            ),
+            Loan.objects.create(
+                loan_type="car", amount=600, tenure=6, interest_rate=6,
+                status="approved", customer=customer
+            ),
+        ]
+
+        result = amortization.backtest_rate_change(
+            Loan.objects.order_by("id"), 2
+        )
+        self.assertEqual(sorted(result["id"]), [loan.id for loan in loans])
+        emis = dict(zip(result["id"], amortization.to_cents(result["emi"])))
+        new_emis = dict(zip(result["id"], amortization.to_cents(result["new_emi"])))
+        self.assertEqual(emis[loans[0].id], 104)
+        self.assertEqual(new_emis[loans[0].id], 106)
+        self.assertEqual(emis[loans[1].id], 103)
+        self.assertEqual(new_emis[loans[1].id], 104)
+
+
+class TestDatabases(TestMixin):
+
+    def test_0010_test_connection_health_checks(self):
+        """
+        Check a kept connection that was dropped is reopened at the start
+        of the next request when health checks are on
+        """
+        path = os.path.join(tempfile.mkdtemp(), "health.sqlite3")
+        for health_checks in [True, False]:
+            handler = ConnectionHandler({"default": {
+                "ENGINE": "loan.db.sqlite3", "NAME": path,
+                "CONN_MAX_AGE": None, "CONN_HEALTH_CHECKS": health_checks,
+            }})
+            wrapper = handler["default"]
+            # First request
+            wrapper.close_if_unusable_or_obsolete()
+            with wrapper.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            wrapper.close_if_unusable_or_obsolete()
+            kept = wrapper.connection
+            self.assertIsNotNone(kept)
+
+            # The connection goes away between requests
+            kept.close()
+            wrapper.close_if_unusable_or_obsolete()
+            if not health_checks:
+                with self.assertRaises(Exception):
+                    with wrapper.cursor() as cursor:
+                        cursor.execute("SELECT 1")
+                continue
+            with wrapper.cursor() as cursor:
+                cursor.execute("SELECT 1")
+                self.assertEqual(cursor.fetchone(), (1,))
+            self.assertIsNot(wrapper.connection, kept)
+
+            # Only once per request
+            with CaptureQueriesContext(wrapper) as queries:
+                wrapper.cursor().execute("SELECT 2")
+            self.assertEqual(len(queries), 1)
+            wrapper.close()
+
+
+# The ASGI app runs each request in its own thread, with its own
+# connection, which only sees committed rows
+@override_settings(USE_READ_REPLICA=False)
+class TestAsgi(TransactionTestCase):
+
+    def setUp(self):
+        User = get_user_model()
+        self.agent = User.objects.create(username="agent", is_agent=True)
+        customer = CustomerProfile.objects.create(
+            user=User.objects.create(username="customer", is_customer=True),
+            phone=92333333, street_address="spring creek", zip_code=2301,
+            city="noida", country="IN",
+        )
+        self.loans = [
+            Loan.objects.create(
+                loan_type="home", amount=1000, tenure=5, interest_rate=8,
+                customer=customer
+            )
+            for number in range(3)
+        ]
+
+    def get(self, path, query_string=b""):
+        """
+        ASGI messages the app sends for a GET as the agent
+        """
+        token = make_token(self.agent).encode()
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            messages.append(message)
+
+        async_to_sync(application)({
+            "type": "http", "asgi": {"version": "3"}, "http_version": "1.1",
+            "method": "GET", "scheme": "http", "path": path,
+            "query_string": query_string, "root_path": "",
+            "server": ("testserver", 80), "client": ("127.0.0.1", 1000),
+            "headers": [(b"authorization", b"Bearer %s" % token)],
+        }, receive, send)
+        return messages
+
+    def test_0010_test_streaming_export(self):
+        """
+        Check an export served by the ASGI app streams every row
+        """
+        with override_settings(EXPORT_CHUNK_SIZE=2):
+            messages = self.get("/api/loan-requests/export/", b"type=csv")
+        self.assertEqual(messages[0]["status"], 200)
+        body = b"".join(message.get("body", b"") for message in messages[1:])
+        lines = body.decode().splitlines()
+        self.assertEqual(lines[0].split(",")[0], "id")
+        self.assertEqual(
+            [int(line.split(",")[0]) for line in lines[1:]],
+            [loan.id for loan in self.loans]
+        )
+        self.assertFalse(messages[-1].get("more_body"))
+
+    def test_0020_test_async_middleware_chain(self):
+        """
+        Check every middleware runs natively under ASGI, so async views do
+        not hold a thread for the whole request, and queries are counted
+        """
+        self.assertTrue(asyncio.iscoroutinefunction(
+            ASGIHandler()._middleware_chain
+        ))
+        with override_settings(QUERY_COUNT_HEADER=True):
+            messages = self.get("/api/async/loan-requests/")
+        self.assertEqual(messages[0]["status"], 200)
+        headers = dict(messages[0]["headers"])
+        self.assertGreater(int(headers[b"X-Query-Count"]), 0)
+
+
+class TestReplicaRouting(TransactionTestCase):
+    # A replica alias mirroring the test database, on any backend. It only
+    # sees committed rows, hence no TestCase
+    REPLICA = "test_replica"
+    databases = "__all__"
+
+    @classmethod
+    def setUpClass(cls):
+        default = connections["default"].settings_dict
+        connections.settings[cls.REPLICA] = {
+            **default, "TEST": {**default["TEST"], "MIRROR": "default"},
+        }
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[cls.REPLICA].close()
+        del connections[cls.REPLICA]
+        del connections.settings[cls.REPLICA]
+
+    @override_settings(
+        USE_READ_REPLICA=True, READ_REPLICAS=[REPLICA], RESPONSE_CACHE_TIMEOUT=0
+    )
+    def test_0010_test_replica_reads(self):
+        """
+        Check GET requests read from a replica, writes use the primary and
+        a user reads from the primary for a while after writing
+        """
+        cache.clear()
+        User = get_user_model()
+        admin = User.objects.create(username="admin", is_superuser=True, is_staff=True)
+        agent = User.objects.create(username="agent", is_agent=True)
+        customer = CustomerProfile.objects.create(
+            user=User.objects.create(username="customer", is_customer=True),
+            phone=92333333, street_address="spring creek", zip_code=2301,
+            city="noida", country="IN",
+        )
+        loan = Loan.objects.create(
+            loan_type="home", amount=1000, tenure=5, interest_rate=8,
+            customer=customer
+        )
+        loan_url = '/api/loan-requests/%d/?format=json' % loan.id
+
+        def reads_loans(url, method=client.get, **kwargs):
+            with ExitStack() as stack:
+                captures = [
+                    stack.enter_context(CaptureQueriesContext(connections[alias]))
+                    for alias in ["default", *settings.READ_REPLICAS]
+                ]
+                response = method(url, **kwargs)
+                if response.streaming:
+                    b"".join(response.streaming_content)
+            self.assertIn(response.status_code, [200, 201], url)
+            found = [
+                any('"loan_loan"' in query["sql"] for query in queries.captured_queries)
+                for queries in captures
+            ]
+            return ["primary", "replica"][found.index(True) > 0]
+
+        client.force_login(admin)
+        for url in [
+            '/api/loan-requests/?format=json', loan_url,
+            '/api/loan-requests/export/?type=csv', '/api/reports/loan-types/',
+            '/admin/loan/loan/',
+        ]:
+            self.assertEqual(reads_loans(url), "replica", url)
+
+        client.force_login(agent)
+        self.assertEqual(reads_loans(
+            loan_url, client.put, content_type='application/json',
+            data=json.dumps({
+                "loan_type": "car", "amount": 1000, "tenure": 5,
+                "interest_rate": 8, "customer": customer.id,
+            })
+        ), "primary")
+        # The agent sees their edit, other users may read a stale replica
+        self.assertEqual(reads_loans(loan_url), "primary")
+        client.force_login(admin)
+        self.assertEqual(reads_loans(loan_url), "replica")
+        client.force_login(agent)
+        self.assertEqual(reads_loans(loan_url), "primary")
+        # Until the signed cookie expires
+        del client.cookies[STICKY_COOKIE]
+        self.assertEqual(reads_loans(loan_url), "replica")
+        client.logout()
@@ -1,17 +1,32 @@
 import json
+from decimal import Decimal
 from django.conf import settings
+from django.db import transaction
 from django.shortcuts import render,get_object_or_404
 from rest_framework.parsers import JSONParser
-from .models import CustomerProfile, Loan
-from .serializers import CustomerSerializer, LoanSerializer, CustomerLoanSerializer
+from .models import CustomerProfile, DailySummary, Loan, LoanQuerySet, User
+from .serializers import (
+    CustomerSerializer, LoanSerializer, CustomerLoanSerializer,
+    BulkLoanSerializer, LoanIdsSerializer, PaymentSerializer,
+    LoanHistorySerializer,
+)
+from .parsers import NDJSONParser
+from .bulk import bulk_create_children
+from .caching import cached_response
+from .authentication import SignedTokenAuthentication, token_response
+from .pagination import KeysetPagination
+from .filters import DailySummaryFilter, LoanFilter, PortfolioFilter
+from . import exports, reports
 from rest_framework.renderers import JSONRenderer
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 import io
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework import status
 from rest_framework.response import Response
-from rest_framework import viewsets
+from rest_framework import serializers, viewsets
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.views import APIView
+from rest_framework.authtoken.serializers import AuthTokenSerializer
 from django.shortcuts import  render, redirect
 from .forms import NewUserForm
 from django.contrib.auth import login
@@ -23,8 +38,9 @@ from django.contrib.auth.decorators import login_required
 from rest_framework.reverse import reverse
 from rest_framework.renderers import TemplateHTMLRenderer
 from rest_framework.decorators import action
-from django.shortcuts import get_object_or_404
+from rest_framework.exceptions import AuthenticationFailed, NotFound, ValidationError
 from django.core.exceptions import PermissionDenied
+from django.core.exceptions import ValidationError as ModelValidationError
 
 
 
@@ -68,6 +84,23 @@ class CanEditLoanRequest(permissions.BasePermission):
         )
 
 
+# Payments are recorded by agents and admins, customers can only read the
+# ledger of their own loans
+class CanRecordPayment(CanEditLoanRequest):
+    def has_permission(self, request, view):
+        if request.method == "POST":
+            return request.user.is_authenticated and (
+                request.user.is_agent or request.user.is_admin()
+            )
+        return super().has_permission(request, view)
+
+
+# Only admin can approve or reject loan requests
+class CanReviewLoanRequest(permissions.BasePermission):
+    def has_permission(self, request, view):
+        return request.user.is_authenticated and request.user.is_admin()
+
+
 class IsOwnerOrAdmin(permissions.BasePermission):
     def has_permission(self, request, view):
         if not request.user.is_authenticated:
@@ -86,6 +119,20 @@ class IsOwnerOrAdmin(permissions.BasePermission):
         return True
 
 
+# Agents and admins see every record, customers only their own. Shared by
+# the viewsets and loan.async_views
+def visible_customers(queryset, user):
+    if user.is_authenticated and (user.is_admin() or user.is_agent):
+        return queryset
+    return queryset.filter(user=user.id)
+
+
+def visible_loans(queryset, user):
+    if user.is_authenticated and (user.is_admin() or user.is_agent):
+        return queryset
+    return queryset.filter(customer__user=user.id)
+
+
 def index(request):
     return render(request,'index.html')
 
@@ -110,15 +157,100 @@ def register_request(request):
     )
 
 
+#Signed tokens for API clients, see loan.authentication
+class ObtainTokenView(APIView):
+    """
+    POST {"username": ..., "password": ...} returns a token for the
+    Authorization: Bearer <token> header, valid for API_TOKEN_MAX_AGE
+    seconds
+    """
+    authentication_classes = []
+    permission_classes = []
+    renderer_classes = [JSONRenderer]
+
+    def post(self, request):
+        serializer = AuthTokenSerializer(
+            data=request.data, context={"request": request}
+        )
+        serializer.is_valid(raise_exception=True)
+        return Response(token_response(serializer.validated_data["user"]))
+
+
+class RefreshTokenView(APIView):
+    """
+    POST with a token that has not expired returns a new one. The user is
+    reloaded, so role changes and deactivation apply from here on.
+    """
+    authentication_classes = [SignedTokenAuthentication]
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [JSONRenderer]
+
+    def post(self, request):
+        user = User.objects.filter(pk=request.user.pk, is_active=True).first()
+        if user is None:
+            raise AuthenticationFailed("User inactive or deleted.")
+        return Response(token_response(user))
+
+
+#Content negotiation between the HTML pages and API clients
+class JSONModeMixin:
+    """
+    Renders templates by default and JSON when the client asks for it with
+    ?format=json or Accept: application/json. In JSON mode, writes return
+    the serialized object with 201/200/204 instead of redirecting.
+    """
+    renderer_classes = [TemplateHTMLRenderer, JSONRenderer]
+
+    def wants_json(self):
+        return self.request.accepted_renderer.format == 'json'
+
+
+class SingleFetchMixin:
+    """
+    Loads the object of a detail request once. edit, update and the
+    rendered response share it, so it is fetched and permission checked a
+    single time per request.
+    """
+    def get_object(self):
+        if not hasattr(self, '_object'):
+            self._object = super().get_object()
+        return self._object
+
+
+class ExportMixin:
+    """
+    GET <list url>/export/?type=csv|ndjson streams every row the list
+    would return, with the same filters and role scoping, unpaginated
+    """
+    export_columns = None
+    export_name = None
+
+    @action(methods=["GET"], detail=False, renderer_classes=[JSONRenderer])
+    def export(self, request):
+        kind = request.query_params.get("type", exports.CSV)
+        if kind not in exports.CONTENT_TYPES:
+            raise ValidationError({"type": ["Expected csv or ndjson."]})
+        queryset = self.filter_queryset(self.get_queryset())
+        response = StreamingHttpResponse(
+            exports.lines(kind, queryset, self.export_columns),
+            content_type=exports.CONTENT_TYPES[kind],
+        )
+        response["Content-Disposition"] = 'attachment; filename="%s.%s"' % (
+            self.export_name, kind
+        )
+        return response
+
+
 #Customer profiles view set
-class CustomerModelViewSet(viewsets.ModelViewSet):
+class CustomerModelViewSet(SingleFetchMixin, ExportMixin, JSONModeMixin, viewsets.ModelViewSet):
     queryset = CustomerProfile.objects.all()
     serializer_class = CustomerSerializer
     permission_classes = [IsOwnerOrAdmin, IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
     search_fields = ['city']
     filterset_fields = ['city','country']
-    renderer_classes = [TemplateHTMLRenderer] 
+    export_columns = exports.CUSTOMER_COLUMNS
+    export_name = "customers"
 
 
 
@@ -128,38 +260,48 @@ class CustomerModelViewSet(viewsets.ModelViewSet):
         """
         Renders form to edit customers
         """
+        customer = self.get_object()
         if request.method == "POST":
-            customer = get_object_or_404(CustomerProfile, pk=pk)
             if request.user.is_agent or request.user.is_admin():
                 return self.update(request, pk)
             else:
                 raise PermissionDenied()
-        customer = get_object_or_404(CustomerProfile, pk=pk)
         return Response(
             {'serializer': CustomerSerializer(customer), "customer": pk},
             template_name='edit_profile.html'
         )
 
-    def update(self, request, pk=None):
-        super(self.__class__, self).update(request, pk)
-        customer =  get_object_or_404(CustomerProfile, pk=pk)
+    def update(self, request, pk=None, **kwargs):
+        response = super(self.__class__, self).update(request, pk, **kwargs)
+        if self.wants_json():
+            return response
         return Response(
-            {"customer": customer}, template_name='userprofile.html'
+            {"customer": self.get_object()}, template_name='userprofile.html'
         )
 
+    @cached_response(CustomerProfile, User)
     def list(self, request):
-        queryset = self.get_queryset()
+        if self.wants_json():
+            page = self.paginate_queryset(self.get_queryset())
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
+        # Load only the columns customers.html renders
+        queryset = self.get_queryset().only(
+            'id', 'phone', 'street_address', 'zip_code', 'city', 'country',
+            'user', 'user__first_name', 'user__last_name',
+        )
 
         return Response(
             {"customers": queryset}, template_name='customers.html'
         )
 
+    @cached_response(CustomerProfile, User)
     def retrieve(self, request, pk=None):
-        super(self.__class__, self).retrieve(request, pk)
-        customer =  get_object_or_404(CustomerProfile, pk=pk)
-
+        if self.wants_json():
+            return super(self.__class__, self).retrieve(request, pk)
         return Response(
-            {"customer": customer},
+            {"customer": self.get_object()},
             template_name='userprofile.html'
         )
 
@@ -168,7 +310,7 @@ class CustomerModelViewSet(viewsets.ModelViewSet):
         Show all customers to agent and show customer only their
         record
         """
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().select_related('user')
 
 
         city = self.request.query_params.get('city',None)
@@ -182,13 +324,7 @@ class CustomerModelViewSet(viewsets.ModelViewSet):
             queryset =  queryset.filter(country=country)
         
         
-        user = self.request.user
-        if user.is_authenticated and (user.is_admin() or user.is_agent):
-            return queryset
-
-       
-
-        return queryset.filter(user=user.id)
+        return visible_customers(queryset, self.request.user)
     
     
 
@@ -198,13 +334,15 @@ class CustomerModelViewSet(viewsets.ModelViewSet):
 
 
 #Loan request view set
-class LoanModelViewSet(viewsets.ModelViewSet):
+class LoanModelViewSet(SingleFetchMixin, ExportMixin, JSONModeMixin, viewsets.ModelViewSet):
     queryset = Loan.objects.all()
     serializer_class = LoanSerializer
     permission_classes = [CanEditLoanRequest, IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
-    filterset_fields = ['start_date']
-    renderer_classes = [TemplateHTMLRenderer]
+    filterset_class = LoanFilter
+    pagination_class = KeysetPagination
+    export_columns = exports.LOAN_COLUMNS
+    export_name = "loans"
 
     def get_serializer_class(self):
         if self.request.user.is_customer:
@@ -226,21 +364,208 @@ class LoanModelViewSet(viewsets.ModelViewSet):
             template_name="applyloan.html"
         )
 
+    @action(
+        methods=["POST"], detail=False,
+        permission_classes=[CanEditLoanRequest, IsAuthenticated],
+        parser_classes=[JSONParser, NDJSONParser],
+        renderer_classes=[JSONRenderer],
+    )
+    def bulk(self, request):
+        """
+        Creates loan-requests from a JSON array or NDJSON body (one loan per
+        line) and returns the id or the validation errors of every row.
+
+        Valid rows are inserted in batches inside one transaction, invalid
+        rows are skipped.
+        """
+        if not request.user.is_agent:
+            raise PermissionDenied()
+        rows = request.data
+        if not isinstance(rows, list):
+            return Response(
+                {"detail": "Expected a list of loans."},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(rows) > settings.BULK_LOAN_MAX_ROWS:
+            return Response(
+                {"detail": "At most %d loans can be created at once."
+                    % settings.BULK_LOAN_MAX_ROWS},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        # One serializer validates every row, building its fields per row
+        # would cost more than the validation itself
+        serializer = BulkLoanSerializer()
+        results = []
+        valid = []
+        for number, row in enumerate(rows):
+            try:
+                valid.append((number, serializer.run_validation(row)))
+            except ValidationError as exc:
+                results.append({"row": number, "errors": exc.detail})
+
+        # Check the customers of all rows with one query
+        customer_ids = set(
+            CustomerProfile.objects.filter(
+                id__in={data["customer"] for number, data in valid}
+            ).values_list("id", flat=True)
+        )
+        rates = {
+            loan_type: Decimal(rate)
+            for loan_type, rate in settings.INTEREST_RATE.items()
+        }
+
+        loans = []
+        for number, data in valid:
+            if data["customer"] not in customer_ids:
+                results.append({"row": number, "errors": {
+                    "customer": ["Customer %s does not exist." % data["customer"]]
+                }})
+                continue
+            # New loans only get dates and an emi on approval, so there is
+            # nothing for Loan.save to compute here
+            loans.append((number, Loan(
+                customer_id=data["customer"], loan_type=data["loan_type"],
+                amount=data["amount"], tenure=data["tenure"],
+                interest_rate=rates[data["loan_type"]],
+                created_by=request.user,
+            )))
+
+        with transaction.atomic():
+            created = bulk_create_children(Loan, [loan for number, loan in loans])
+            # bulk_create_children sends no post_save for the summary
+            DailySummary.add_loans(created)
+        results += [{"row": number, "id": loan.id} for number, loan in loans]
+        results.sort(key=lambda result: result["row"])
+
+        if not loans and results:
+            response_status = status.HTTP_400_BAD_REQUEST
+        elif len(loans) < len(results):
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_201_CREATED
+        return Response(
+            {
+                "created": len(loans), "failed": len(results) - len(loans),
+                "results": results,
+            },
+            status=response_status
+        )
+
+    @action(
+        methods=["POST"], detail=False,
+        permission_classes=[CanReviewLoanRequest, IsAuthenticated],
+        renderer_classes=[JSONRenderer],
+    )
+    def approve(self, request):
+        """
+        Approves the loan-requests listed in {"ids": [...]} in bulk
+        """
+        return self.review(request, "approved", LoanQuerySet.approve)
+
+    @action(
+        methods=["POST"], detail=False,
+        permission_classes=[CanReviewLoanRequest, IsAuthenticated],
+        renderer_classes=[JSONRenderer],
+    )
+    def reject(self, request):
+        """
+        Rejects the loan-requests listed in {"ids": [...]} in bulk
+        """
+        return self.review(request, "rejected", LoanQuerySet.reject)
+
+    def review(self, request, outcome, apply):
+        serializer = LoanIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = set(serializer.validated_data["ids"])
+
+        changed, skipped = apply(Loan.objects.filter(id__in=ids))
+        return Response({
+            outcome: sorted(changed),
+            "skipped": sorted(skipped),
+            "not_found": sorted(ids - set(changed) - set(skipped)),
+        })
+
+    @action(
+        methods=["GET", "POST"], detail=True,
+        permission_classes=[CanRecordPayment, IsAuthenticated],
+        renderer_classes=[JSONRenderer],
+    )
+    def payments(self, request, pk=None):
+        """
+        Lists the payments of a loan, or posts a new one to its ledger
+        """
+        loan = self.get_object()
+        if request.method == "GET":
+            return Response(PaymentSerializer(
+                loan.payments.order_by("paid_at", "id"), many=True
+            ).data)
+
+        serializer = PaymentSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            payment = loan.post_payment(
+                recorded_by=request.user, **serializer.validated_data
+            )
+        except ModelValidationError as exc:
+            raise ValidationError(exc.messages)
+        return Response({
+            "payment": PaymentSerializer(payment).data,
+            "loan": LoanSerializer(loan).data,
+        }, status=status.HTTP_201_CREATED)
+
+    @action(
+        methods=["GET"], detail=True,
+        permission_classes=[CanEditLoanRequest, IsAuthenticated],
+        renderer_classes=[JSONRenderer],
+    )
+    def history(self, request, pk=None):
+        """
+        Lists the edits of a loan, or with ?at=<datetime> returns the loan
+        as it was at that time
+        """
+        loan = self.get_object()
+        if "at" not in request.query_params:
+            return Response(LoanHistorySerializer(
+                loan.history.order_by("changed_at", "id"), many=True
+            ).data)
+
+        try:
+            when = serializers.DateTimeField().to_internal_value(
+                request.query_params["at"]
+            )
+        except ValidationError as exc:
+            raise ValidationError({"at": exc.detail})
+        state = loan.as_of(when)
+        if state is None:
+            raise NotFound("The loan did not exist at %s." % when.isoformat())
+        return Response(LoanSerializer(state).data)
+
     @action(methods=["GET", "POST"], detail=True, permission_classes=[CanEditLoanRequest, IsAuthenticated])
     def edit(self, request, pk):
         """
         Renders form to edit loan-request
         """
         if request.method == "POST":
-            loan = get_object_or_404(Loan, pk=pk)
+            loan = self.get_object()
             if request.user.is_agent and loan.status != 'approved':
                 return self.update(request, pk)
             else:
                 raise PermissionDenied()
         return self.retrieve(request, pk)
 
+    # Loan lists show the customer's city, country and name
+    @cached_response(Loan, CustomerProfile, User)
     def list(self, request):
-        queryset = self.get_queryset()
+        # Loan.customer renders as "<first name> <last name> - <city>,
+        # <country>", so only those customer and user columns are loaded.
+        # Every loan column is kept so the FieldTracker sees no deferred
+        # fields.
+        queryset = self.filter_queryset(self.get_queryset()).only(
+            *[field.name for field in Loan._meta.concrete_fields],
+            'customer__city', 'customer__country', 'customer__user',
+            'customer__user__first_name', 'customer__user__last_name',
+        )
         if request.GET.get('customer'):
             customer = CustomerProfile.objects.filter(
                 id=int(request.GET.get('customer'))
@@ -249,24 +574,37 @@ class LoanModelViewSet(viewsets.ModelViewSet):
                 return Response(template_name='errors/404.html')
             queryset = queryset.filter(customer=customer.id)
 
+        # Only one page of loans is loaded, seeking on (created, id)
+        page = self.paginate_queryset(queryset)
+        if self.wants_json():
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+
         return Response(
-            {"loan_requests": queryset},
+            {
+                "loan_requests": page,
+                "pagination": self.paginator.get_html_context(),
+            },
             template_name='loan-requests.html'
         )
 
+    @cached_response(Loan, CustomerProfile, User)
     def retrieve(self, request, pk=None):
-        super(self.__class__, self).retrieve(request, pk)
-        loan = get_object_or_404(Loan, pk=pk)
+        if self.wants_json():
+            return super(self.__class__, self).retrieve(request, pk)
+        return self.render_form(pk)
+
+    def render_form(self, pk):
         return Response(
-            {'serializer': self.get_serializer_class()(loan), "loan": pk},
+            {'serializer': self.get_serializer(self.get_object()), "loan": pk},
             template_name='applyloan.html',
         )
 
     def perform_create(self, serializer):
         if self.request.user.is_customer:
-            serializer.save(customer=self.request.user.customer, interest_rate=settings.INTEREST_RATE[self.request.data['loan_type']])
+            serializer.save(customer=self.request.user.customer, interest_rate=settings.INTEREST_RATE[self.request.data['loan_type']], created_by=self.request.user)
         else:
-            serializer.save()
+            serializer.save(created_by=self.request.user)
 
     def create(self, request):
 
@@ -274,18 +612,25 @@ class LoanModelViewSet(viewsets.ModelViewSet):
         if request.user.is_customer and request.data.get("customer") \
                 and request.user.customer.id != int(request.data.get("customer")):
             raise PermissionDenied()
-        super(self.__class__, self).create(request)
+        response = super(self.__class__, self).create(request)
+        if self.wants_json():
+            return response
         messages.success(request, "Loan Request has been added successfully!")
         return redirect(reverse('loan-list'))
 
-    def update(self, request, pk=None):
-        loan = get_object_or_404(Loan, pk=pk)
-        super(self.__class__, self).update(request, pk)
+    # Renders the updated loan straight away instead of redirecting to
+    # the detail page, which would load it again
+    def update(self, request, pk=None, **kwargs):
+        response = super(self.__class__, self).update(request, pk, **kwargs)
+        if self.wants_json():
+            return response
         messages.success(request, "Loan Request has been updated successfully!")
-        return redirect(reverse('loan-detail', kwargs={'pk': pk}))
+        return self.render_form(pk)
 
     def destroy(self, request, pk=None):
-        super(self.__class__, self).destroy(request, pk)
+        response = super(self.__class__, self).destroy(request, pk)
+        if self.wants_json():
+            return response
         return redirect(reverse('loan-list'))
 
     def get_queryset(self):
@@ -293,33 +638,51 @@ class LoanModelViewSet(viewsets.ModelViewSet):
         Show all loan-requests to agent and show customer only their
         own loan-requests
         """
-        queryset = super().get_queryset()
+        queryset = super().get_queryset().select_related('customer__user')
 
-        start_date = self.request.query_params.get('start_date',None)
-        if start_date is not None:
-            start_date = start_date
-            queryset =  queryset.filter(start_date__date=start_date)
+        # Query parameter filters are applied by LoanFilter
+        return visible_loans(queryset, self.request.user)
 
-        end_date = self.request.query_params.get('end_date',None)
-        if end_date is not None:
-            end_date = end_date
-            queryset =  queryset.filter(end_date__date=end_date)
 
+#Portfolio reports for management, aggregated by the database
+class ReportViewSet(viewsets.GenericViewSet):
+    """
+    Every report takes the PortfolioFilter query parameters: status,
+    loan_type, tenure, country and the start_date / end_date ranges
+    """
+    queryset = Loan.objects.all()
+    permission_classes = [CanReviewLoanRequest, IsAuthenticated]
+    renderer_classes = [JSONRenderer]
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = PortfolioFilter
+    pagination_class = None
 
-        tenure = self.request.query_params.get('tenure',None)
-        if tenure is not None:
-            tenure = tenure
-            queryset =  queryset.filter(tenure=tenure)
-
+    def report(self, build):
+        return Response(build(self.filter_queryset(self.get_queryset())))
 
-        status = self.request.query_params.get('status',None)
-        if status is not None:
-            status = status
-            queryset =  queryset.filter(status=status)
+    @action(methods=["GET"], detail=False, url_path="loan-types")
+    def loan_types(self, request):
+        return self.report(reports.by_loan_type)
 
+    @action(methods=["GET"], detail=False)
+    def agents(self, request):
+        return self.report(reports.by_agent)
 
-        user = self.request.user
-        if user.is_authenticated and (user.is_admin() or user.is_agent):
-            return queryset
+    @action(methods=["GET"], detail=False)
+    def emi(self, request):
+        return self.report(reports.emi_by_month)
 
-        return queryset.filter(customer__user=user.id)
\ No newline at end of file
+    @action(methods=["GET"], detail=False)
+    def daily(self, request):
+        """
+        Loans created per day, loan type and status, read from the daily
+        summary. Takes day_after, day_before, loan_type and status.
+        """
+        summaries = DailySummaryFilter(
+            request.query_params, queryset=DailySummary.objects.filter(loans__gt=0)
+        )
+        if not summaries.is_valid():
+            raise ValidationError(summaries.errors)
+        return Response(summaries.qs.order_by("day", "loan_type", "status").values(
+            "day", "loan_type", "status", "loans", *DailySummary.SUMMED_FIELDS
+        ))
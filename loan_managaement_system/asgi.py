@@ -9,8 +9,77 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
+from asgiref.sync import ThreadSensitiveContext, sync_to_async
+from django.core.handlers import asgi
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'loan_managaement_system.settings')
 
-application = get_asgi_application()
+
+class ASGIHandler(asgi.ASGIHandler):
+    """
+    Django 3.2 iterates a streaming response on the event loop, where the
+    database cursor of an export can not be read: the client got the
+    first line and a SynchronousOnlyOperation cut the body short. Chunks
+    are read with sync_to_async in the thread of the request instead, as
+    Django 4.2 does for sync iterators.
+    """
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': self.response_headers(response),
+        })
+        parts = iter(response)
+        read = sync_to_async(next, thread_sensitive=True)
+        while True:
+            part = await read(parts, None)
+            if part is None:
+                break
+            for chunk, last in self.chunk_bytes(part):
+                await send({
+                    'type': 'http.response.body',
+                    'body': chunk,
+                    'more_body': True,
+                })
+        await send({'type': 'http.response.body'})
+        await sync_to_async(response.close, thread_sensitive=True)()
+
+    def response_headers(self, response):
+        # As ASGIHandler.send_response
+        headers = []
+        for header, value in response.items():
+            if isinstance(header, str):
+                header = header.encode('ascii')
+            if isinstance(value, str):
+                value = value.encode('latin1')
+            headers.append((bytes(header), bytes(value)))
+        for cookie in response.cookies.values():
+            headers.append(
+                (b'Set-Cookie', cookie.output(header='').encode('ascii').strip())
+            )
+        return headers
+
+
+class ThreadPerRequest:
+    """
+    Gives every request its own thread for the sync code it runs
+    (middleware, signals and the database calls of loan.async_views).
+    Without a context Django 3.2 runs the sync code of all requests on one
+    shared thread, one request at a time. Django 4.0 does the same in
+    ASGIHandler.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        async with ThreadSensitiveContext():
+            return await self.app(scope, receive, send)
+
+
+# As get_asgi_application(), with the handler above
+django.setup(set_prefix=False)
+application = ThreadPerRequest(ASGIHandler())
@@ -44,6 +44,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so the queries of sessions and authentication count as well
+    'loan.middleware.QueryCountMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -51,6 +53,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'loan.routers.ReplicaRoutingMiddleware',
 ]
 
 ROOT_URLCONF = 'loan_managaement_system.urls'
@@ -77,18 +80,59 @@ WSGI_APPLICATION = 'loan_managaement_system.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# Read from the environment, the defaults match docker-compose.yml.
+# loan.db.postgresql is Django's backend with connection health checks and
+# an optional pool, loan.db.sqlite3 the same on SQLite for local trials.
+_pool_size = int(os.environ.get('DB_POOL_SIZE', 0))
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'postgres',
-        'USER': 'postgres',
-        'PASSWORD': 'postgres',
-        'HOST': 'db',
-        'PORT': 5432,
-
+        'ENGINE': os.environ.get('DB_ENGINE', 'loan.db.postgresql'),
+        'NAME': os.environ.get('DB_NAME', 'postgres'),
+        'USER': os.environ.get('DB_USER', 'postgres'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', 'postgres'),
+        'HOST': os.environ.get('DB_HOST', 'db'),
+        'PORT': int(os.environ.get('DB_PORT', 5432)),
+        # Seconds a connection is kept for later requests of its thread, 0
+        # closes it after every request. Under ASGI and runserver every
+        # request runs in a new thread, which would leave one connection
+        # open per request: keep 0 there and use the pool. Only raise it
+        # for WSGI servers with long lived threads. With a pool, closing
+        # hands the connection back, so it is always 0.
+        'CONN_MAX_AGE': 0 if _pool_size else int(os.environ.get('DB_CONN_MAX_AGE', 0)),
+        # Test a kept connection before a request uses it
+        'CONN_HEALTH_CHECKS': os.environ.get('DB_CONN_HEALTH_CHECKS', '1') == '1',
+        # Connections per process shared by all threads, 0 for no pool
+        'POOL_SIZE': _pool_size,
     }
 }
 
+# Read replicas for GET requests (loan.routers), with the primary's settings
+# unless overridden. DB_REPLICA_HOST and DB_REPLICA_NAME take comma
+# separated lists for several replicas.
+READ_REPLICAS = []
+_replica_hosts = [host for host in os.environ.get('DB_REPLICA_HOST', '').split(',') if host]
+_replica_names = [name for name in os.environ.get('DB_REPLICA_NAME', '').split(',') if name]
+for _number in range(max(len(_replica_hosts), len(_replica_names))):
+    _alias = 'replica' if _number == 0 else 'replica_%d' % (_number + 1)
+    DATABASES[_alias] = dict(
+        DATABASES['default'],
+        NAME=(_replica_names[_number:] or [DATABASES['default']['NAME']])[0],
+        HOST=(_replica_hosts[_number:] or [DATABASES['default']['HOST']])[0],
+        PORT=int(os.environ.get('DB_REPLICA_PORT', DATABASES['default']['PORT'])),
+        TEST={'MIRROR': 'default'},
+    )
+    READ_REPLICAS.append(_alias)
+
+DATABASE_ROUTERS = ['loan.routers.PrimaryReplicaRouter']
+
+# Send every read to the primary, e.g. while the replicas lag behind
+USE_READ_REPLICA = os.environ.get('DB_USE_REPLICA', '1') == '1'
+
+# Seconds a user's requests keep reading from the primary after they sent
+# a write, longer than the usual replication lag. Tracked in a signed
+# cookie (loan.routers)
+REPLICA_STICKY_SECONDS = int(os.environ.get('DB_REPLICA_STICKY_SECONDS', 10))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -145,6 +189,7 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'root')
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
+        'loan.authentication.SignedTokenAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -155,8 +200,8 @@ REST_FRAMEWORK = {
     ]
     ,
     'DEFAULT_PAGINATION_CLASS':
-        'rest_framework.pagination.PageNumberPagination',
-        'PAGE_SIZE':1
+        'loan.pagination.KeysetPagination',
+        'PAGE_SIZE':25
     
 }
 LOGIN_REDIRECT_URL = "/"
@@ -165,4 +210,64 @@ LOGOUT_REDIRECT_URL = "/"
 
 ALLOWED_HOSTS = ['*']
 
-INTEREST_RATE = { "home": 4, "car": 6, "personal": 8}
\ No newline at end of file
+INTEREST_RATE = { "home": 4, "car": 6, "personal": 8}
+
+# Months of repayment schedule generated ahead of time
+SCHEDULE_MONTHS_AHEAD = 12
+
+# Largest upload accepted by /api/loan-requests/bulk/
+BULK_LOAN_MAX_ROWS = 10000
+
+# Seconds a user's admin-group membership stays cached
+ROLE_CACHE_TIMEOUT = 300
+
+# Rows fetched per round trip by the streaming exports
+EXPORT_CHUNK_SIZE = 2000
+
+# Shared by the role and group caches and the response cache. Processes
+# only share a cache outside of memory, e.g. CACHE_BACKEND
+# django.core.cache.backends.filebased.FileBasedCache with a directory as
+# CACHE_LOCATION, or a Redis backend such as django_redis.cache.RedisCache
+# with a redis:// URL
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'loan-management'),
+    }
+}
+
+# Whether every process sees the same cache. Entries that are invalidated
+# when data changes (admin roles, API responses) are only cached across
+# requests then, a per process cache would keep serving them on the other
+# workers
+SHARED_CACHE = CACHES['default']['BACKEND'] not in (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+# Seconds list and detail responses stay cached (loan.caching), 0 disables
+RESPONSE_CACHE_TIMEOUT = 60
+
+# Seconds a signed API token (loan.authentication) is accepted
+API_TOKEN_MAX_AGE = 300
+
+# Where sessions live, SESSION_MODE is one of
+#   cached_db       the cache, falling back to the database on a miss, so
+#                   most page views make no session query (default)
+#   signed_cookies  the cookie itself, signed with SECRET_KEY, no storage
+#                   at all but a logout can not revoke a copied cookie
+#   db              the database, a query on every request
+# or the dotted path of a session engine
+SESSION_MODE = os.environ.get('SESSION_MODE', 'cached_db')
+SESSION_ENGINE = SESSION_MODE if '.' in SESSION_MODE else \
+    'django.contrib.sessions.backends.%s' % SESSION_MODE
+
+# Expired sessions deleted per statement by manage.py purge_sessions
+SESSION_PURGE_BATCH_SIZE = 5000
+
+# Answer the number of queries of each request in an X-Query-Count header,
+# for benchmarks/load_test.py. Counting costs a little, leave it off in
+# production
+QUERY_COUNT_HEADER = os.environ.get('QUERY_COUNT_HEADER', '0') == '1'
@@ -1,20 +1,27 @@
 from django.contrib import admin
 from django.urls import path, include, re_path
-from loan import views
+from loan import async_views, views
 from rest_framework import routers
-from rest_framework.authtoken.views import obtain_auth_token
 from rest_framework.urlpatterns import format_suffix_patterns
 
 #creating router object
 router = routers.DefaultRouter()
 router.register(r'customers', views.CustomerModelViewSet)
 router.register(r'loan-requests', views.LoanModelViewSet)
+router.register(r'reports', views.ReportViewSet, basename='report')
 
 urlpatterns = [
     path('admin/', admin.site.urls),
    
     path('', include('loan.urls')),
     path('accounts/', include('django.contrib.auth.urls')),
+    # Async read routes for ASGI servers, see loan.async_views
+    path('api/async/loan-requests/', async_views.loan_list, name='async-loan-list'),
+    path('api/async/loan-requests/<int:pk>/', async_views.loan_detail, name='async-loan-detail'),
+    path('api/async/customers/', async_views.customer_list, name='async-customer-list'),
+    path('api/async/customers/<int:pk>/', async_views.customer_detail, name='async-customer-detail'),
+    path('api/token/', views.ObtainTokenView.as_view(), name='api-token'),
+    path('api/token/refresh/', views.RefreshTokenView.as_view(), name='api-token-refresh'),
     path('api/', include(router.urls)),
     path(
         'api-auth/',
@@ -25,5 +32,4 @@ urlpatterns = [
     # path('customer-profiles/',views.viewprofiles, name='profile'),
     # path('customer-profiles/loan-requests', views.loan_requests, name='loan-requests'),
     # path('my-profile/',views.my_profile, name='my-profile'),
-    #path('gettoken/', obtain_auth_token)
 ]
\ No newline at end of file